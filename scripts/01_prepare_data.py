@@ -5,20 +5,17 @@
 生成示例文档数据、产品文档数据和测试查询数据
 """
 
-import json
-import sys
 from pathlib import Path
 
-# 添加项目根目录到路径
-sys.path.insert(0, str(Path(__file__).parent.parent))
+import orjson
 
 
 def load_products(data_path: Path) -> list:
     """加载产品文档数据"""
     products_file = data_path / "raw" / "products.json"
     if products_file.exists():
-        with open(products_file, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(products_file, "rb") as f:
+            return orjson.loads(f.read())
     return []
 
 
@@ -206,8 +203,8 @@ def main():
     print("正在生成示例文档数据...")
     documents = generate_sample_documents()
     docs_file = raw_dir / "sample_docs.json"
-    with open(docs_file, "w", encoding="utf-8") as f:
-        json.dump(documents, f, ensure_ascii=False, indent=2)
+    with open(docs_file, "wb") as f:
+        f.write(orjson.dumps(documents, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
     print(f"已生成 {len(documents)} 个文档 -> {docs_file}")
 
     # 加载产品文档
@@ -216,34 +213,42 @@ def main():
         print(f"\n加载 {len(products)} 个产品文档")
         documents.extend(products)
 
-    # 保存合并后的文档
-    all_docs_file = raw_dir / "all_docs.json"
-    with open(all_docs_file, "w", encoding="utf-8") as f:
-        json.dump(documents, f, ensure_ascii=False, indent=2)
+    # 保存合并后的文档（JSONL，每行一个文档，逐行写入）
+    all_docs_file = raw_dir / "all_docs.jsonl"
+    with open(all_docs_file, "wb") as f:
+        f.writelines(orjson.dumps(doc, option=orjson.OPT_NON_STR_KEYS) + b"\n" for doc in documents)
     print(f"已保存合并文档 -> {all_docs_file}")
 
     # 生成测试查询
     print("\n正在生成测试查询数据...")
     queries = generate_test_queries()
     queries_file = queries_dir / "test_queries.json"
-    with open(queries_file, "w", encoding="utf-8") as f:
-        json.dump(queries, f, ensure_ascii=False, indent=2)
+    with open(queries_file, "wb") as f:
+        f.write(orjson.dumps(queries, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
     print(f"已生成 {len(queries)} 个查询 -> {queries_file}")
 
     # 加载混合查询
     mixed_queries_file = queries_dir / "mixed_queries.json"
     if mixed_queries_file.exists():
-        with open(mixed_queries_file, "r", encoding="utf-8") as f:
-            mixed_queries = json.load(f)
+        with open(mixed_queries_file, "rb") as f:
+            mixed_queries = orjson.loads(f.read())
         print(f"已加载 {len(mixed_queries)} 个混合查询 -> {mixed_queries_file}")
         queries.extend(mixed_queries)
 
+    # 一次遍历统计文档类型和字符数
+    tech_count = product_count = total_chars = 0
+    for doc in documents:
+        doc_id = doc['doc_id']
+        tech_count += doc_id.startswith('doc_')
+        product_count += doc_id.startswith('product_')
+        total_chars += len(doc['content'])
+
     print("\n数据准备完成！")
     print(f"\n文档统计:")
-    print(f"  - 技术文档: {len([d for d in documents if d['doc_id'].startswith('doc_')])}")
-    print(f"  - 产品文档: {len([d for d in documents if d['doc_id'].startswith('product_')])}")
+    print(f"  - 技术文档: {tech_count}")
+    print(f"  - 产品文档: {product_count}")
     print(f"  - 总文档数: {len(documents)}")
-    print(f"  - 总字符数: {sum(len(doc['content']) for doc in documents)}")
+    print(f"  - 总字符数: {total_chars}")
     print(f"\n查询统计:")
     print(f"  - 总查询数: {len(queries)}")
 
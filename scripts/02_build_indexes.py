@@ -5,19 +5,16 @@
 构建 Milvus 和 Elasticsearch 索引
 """
 
-import json
 import sys
 import time
 from pathlib import Path
 
-# 添加项目根目录到路径
-sys.path.insert(0, str(Path(__file__).parent.parent))
-
+import orjson
 from loguru import logger
 
 from src.config.settings import get_config
-from src.models.dense_embedding import GLMEmbedding
-from src.models.sparse_embedding import BM25Sparse
+from src.models.dense_embedding import get_glm_embedding
+from src.models.sparse_embedding import BM25Sparse, tokenize
 from src.pipeline.chunker import DocumentChunker
 from src.database.milvus_client import MilvusClient
 from src.database.es_client import ESClient
@@ -26,49 +23,66 @@ from src.database.seekdb_client import SeekDBClient
 
 def load_documents(data_path: Path) -> list:
     """加载文档数据"""
-    with open(data_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(data_path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def load_jsonl(data_path: Path) -> list:
+    """逐行加载 JSONL 数据"""
+    with open(data_path, "rb") as f:
+        return [orjson.loads(line) for line in f if line.strip()]
 
 
 def load_all_documents(data_dir: Path) -> list:
     """加载所有文档数据（技术文档 + 产品文档）"""
+    # 如果合并文档存在，直接使用，无需再读取分文件
+    all_docs_file = data_dir / "raw" / "all_docs.jsonl"
+    if all_docs_file.exists():
+        return load_jsonl(all_docs_file)
+
     all_docs = []
 
     # 加载技术文档
     sample_docs = data_dir / "raw" / "sample_docs.json"
     if sample_docs.exists():
-        with open(sample_docs, "r", encoding="utf-8") as f:
-            all_docs.extend(json.load(f))
+        with open(sample_docs, "rb") as f:
+            all_docs.extend(orjson.loads(f.read()))
 
     # 加载产品文档
     products = data_dir / "raw" / "products.json"
     if products.exists():
-        with open(products, "r", encoding="utf-8") as f:
-            all_docs.extend(json.load(f))
-
-    # 如果合并文档存在，直接使用
-    all_docs_file = data_dir / "raw" / "all_docs.json"
-    if all_docs_file.exists():
-        with open(all_docs_file, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(products, "rb") as f:
+            all_docs.extend(orjson.loads(f.read()))
 
     return all_docs
 
 
 def load_queries(data_path: Path) -> list:
     """加载查询数据"""
-    with open(data_path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-
-def build_milvus_index(config, documents: list, chunks: list):
-    """构建 Milvus 索引"""
+    with open(data_path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def build_milvus_index(
+    config,
+    documents: list,
+    chunks: list,
+    texts: list = None,
+    tokenized_texts: list = None,
+    bm25_path: Path = None
+):
+    """构建 Milvus 索引
+
+    texts / tokenized_texts 为 main 中预先生成的块文本与分词结果，未提供时在此生成；
+    bm25_path 不为空时保存训练好的 BM25 模型，供检索脚本直接加载
+    """
     logger.info("=" * 50)
     logger.info("开始构建 Milvus 索引")
     logger.info("=" * 50)
 
     # 准备文本列表（用于生成向量）
-    texts = [chunk.content for chunk in chunks]
+    if texts is None:
+        texts = [chunk.content for chunk in chunks]
     chunk_ids = [chunk.chunk_id for chunk in chunks]
     doc_ids = [chunk.doc_id for chunk in chunks]
     titles = [chunk.title for chunk in chunks]
@@ -76,10 +90,11 @@ def build_milvus_index(config, documents: list, chunks: list):
 
     # 先初始化 GLM 模型来检测向量维度
     logger.info("初始化 GLM Embedding 模型并检测向量维度...")
-    dense_model = GLMEmbedding(
+    dense_model = get_glm_embedding(
         api_key=config.glm.api_key,
         model=config.glm.model,
-        auto_detect_dim=True
+        auto_detect_dim=True,
+        cache_path=config.glm.cache_path
     )
     actual_dim = dense_model.dimension
     logger.info(f"检测到的向量维度: {actual_dim}")
@@ -102,7 +117,12 @@ def build_milvus_index(config, documents: list, chunks: list):
     # 生成 Sparse 向量
     logger.info(f"正在生成 Sparse 向量...")
     sparse_model = BM25Sparse(k1=1.5, b=0.75)
-    sparse_model.fit(texts)
+    if tokenized_texts is None:
+        sparse_model.fit(texts)
+    else:
+        sparse_model.fit_pretokenized(tokenized_texts, corpus=texts)
+    if bm25_path is not None:
+        sparse_model.save(bm25_path)
     sparse_vectors = sparse_model.encode_documents()
     logger.info(f"Sparse 向量生成完成: {len(sparse_vectors)} 个")
 
@@ -115,9 +135,12 @@ def build_milvus_index(config, documents: list, chunks: list):
         titles=titles,
         contents=texts,
         metadata_list=metadata_list,
-        dense_vectors=dense_vectors.tolist(),
+        # 直接传入 float32 数组，避免 .tolist() 逐元素装箱为 Python float
+        dense_vectors=dense_vectors,
         sparse_vectors=sparse_vectors
     )
+    # 全部数据插入完成后统一 flush（num_entities 统计依赖已落盘的段）
+    milvus_client.flush()
 
     # 加载到内存
     milvus_client.load_collection()
@@ -131,7 +154,7 @@ def build_milvus_index(config, documents: list, chunks: list):
     return dense_model, sparse_model
 
 
-def build_es_index(config, chunks: list):
+def build_es_index(config, chunks: list, texts: list = None):
     """构建 ES 索引"""
     logger.info("=" * 50)
     logger.info("开始构建 ES 索引")
@@ -153,7 +176,7 @@ def build_es_index(config, chunks: list):
 
     # 创建索引
     try:
-        es_client.create_index(drop_existing=True, use_ik_analyzer=False)
+        es_client.create_index(drop_existing=True, use_ik_analyzer=False, bulk_ingest=True)
         logger.info("ES 索引创建成功")
     except Exception as e:
         logger.error(f"ES 索引创建失败: {e}")
@@ -161,20 +184,23 @@ def build_es_index(config, chunks: list):
         return None
 
     # 准备文档
+    if texts is None:
+        texts = [chunk.content for chunk in chunks]
     documents = []
-    for chunk in chunks:
+    for chunk, content in zip(chunks, texts):
         doc = {
             "id": chunk.chunk_id,
             "doc_id": chunk.doc_id,
             "chunk_id": chunk.chunk_id,
             "title": chunk.title,
-            "content": chunk.content,
+            "content": content,
         }
         documents.append(doc)
 
     # 插入 ES
     logger.info("正在插入数据到 ES...")
-    es_client.insert_documents(documents)
+    with es_client.bulk_load_settings():
+        es_client.insert_documents(documents)
 
     # 获取统计信息
     stats = es_client.get_stats()
@@ -242,11 +268,11 @@ def build_seekdb_index(config, chunks: list):
 
 
 def save_chunks(chunks: list, output_path: Path):
-    """保存分块数据"""
-    chunks_data = [chunk.to_dict() for chunk in chunks]
-
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(chunks_data, f, ensure_ascii=False, indent=2)
+    """保存分块数据（JSONL，每行一个块，逐行写入）"""
+    with open(output_path, "wb") as f:
+        f.writelines(
+            orjson.dumps(chunk.to_dict(), option=orjson.OPT_NON_STR_KEYS) + b"\n" for chunk in chunks
+        )
 
     logger.info(f"分块数据已保存: {output_path}")
 
@@ -272,7 +298,7 @@ def main():
     data_dir = project_root / "data"
 
     # 加载所有文档数据
-    all_docs_file = data_dir / "raw" / "all_docs.json"
+    all_docs_file = data_dir / "raw" / "all_docs.jsonl"
     logger.info(f"加载文档数据: {all_docs_file}")
     documents = load_all_documents(data_dir)
     logger.info(f"文档数量: {len(documents)}")
@@ -306,31 +332,23 @@ def main():
     logger.info(f"分块完成: {len(documents)} 个文档 -> {len(chunks)} 个块")
 
     # 保存分块数据
-    chunks_file = data_dir / "processed" / "chunks.json"
+    chunks_file = data_dir / "processed" / "chunks.jsonl"
     save_chunks(chunks, chunks_file)
 
-    # 文档分块
-    logger.info("=" * 50)
-    logger.info("开始文档分块")
-    logger.info("=" * 50)
-
-    chunker = DocumentChunker(
-        chunk_size=config.chunking.chunk_size,
-        chunk_overlap=config.chunking.chunk_overlap,
-        max_chunks_per_doc=config.chunking.max_chunks_per_doc
-    )
-
-    chunks = chunker.chunk(documents)
-    logger.info(f"分块完成: {len(documents)} 个文档 -> {len(chunks)} 个块")
-
-    # 保存分块数据
-    save_chunks(chunks, chunks_file)
+    # 统一准备块文本与分词结果，供 Milvus（Dense + BM25）和 ES 共用
+    texts = [chunk.content for chunk in chunks]
+    logger.info("正在对分块文本进行分词...")
+    tokenized_texts = [tokenize(text) for text in texts]
 
     # 构建 Milvus 索引
-    dense_model, sparse_model = build_milvus_index(config, documents, chunks)
+    bm25_file = data_dir / "processed" / "bm25.pkl"
+    dense_model, sparse_model = build_milvus_index(
+        config, documents, chunks,
+        texts=texts, tokenized_texts=tokenized_texts, bm25_path=bm25_file
+    )
 
     # 构建 ES 索引
-    es_client = build_es_index(config, chunks)
+    es_client = build_es_index(config, chunks, texts=texts)
 
     # 构建 SeekDB 索引（可选）
     if "--seekdb" in sys.argv or "--all" in sys.argv:
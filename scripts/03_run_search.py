@@ -3,21 +3,26 @@
 检索执行脚本
 
 执行 Dense、Sparse、Hybrid 和 ES 检索
+
+查询的 Dense / Sparse 向量在 main 中统一生成一次，各检索方法按查询顺序复用；
+ES BM25 直接使用查询文本，无需预编码
+
+--replay: 复用 outputs/results/all_results.json 中已覆盖全部查询的检索结果，
+只执行缺失的检索方法（仅调整评估指标时无需重新检索）
 """
 
-import json
 import sys
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Set
-
-# 添加项目根目录到路径
-sys.path.insert(0, str(Path(__file__).parent.parent))
+from typing import Callable, Dict, List, Set
 
+import numpy as np
+import orjson
 from loguru import logger
 from tqdm import tqdm
 
 from src.config.settings import get_config
-from src.models.dense_embedding import GLMEmbedding
+from src.models.dense_embedding import get_glm_embedding
 from src.models.sparse_embedding import BM25Sparse
 from src.search.hybrid_search import HybridSearcher
 from src.search.es_mv_hybrid import ESMVHybridSearcher
@@ -26,22 +31,25 @@ from src.database.milvus_client import MilvusClient
 from src.database.es_client import ESClient
 from src.database.seekdb_client import SeekDBClient
 
+# 评估只需要文档 ID，Milvus 检索只返回该字段以减少传输和解析开销
+ID_OUTPUT_FIELDS = ["doc_id"]
+
 
 def load_queries(data_path: Path) -> list:
     """加载查询数据"""
-    with open(data_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(data_path, "rb") as f:
+        return orjson.loads(f.read())
 
 
 def load_chunks(data_path: Path) -> list:
-    """加载分块数据"""
-    with open(data_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    """加载分块数据（JSONL，每行一个块）"""
+    with open(data_path, "rb") as f:
+        return [orjson.loads(line) for line in f if line.strip()]
 
 
 def milvus_dense_search(
     hybrid_searcher: HybridSearcher,
-    dense_model: GLMEmbedding,
+    query_dense_vectors: np.ndarray,
     queries: list,
     top_k: int
 ) -> Dict[str, List[str]]:
@@ -50,20 +58,14 @@ def milvus_dense_search(
     logger.info("执行 Dense 向量检索")
     logger.info("=" * 50)
 
-    results = {}
-
-    for query_item in tqdm(queries, desc="Dense 检索"):
-        query_id = query_item["query_id"]
-        query_text = query_item["query"]
-
-        # 生成查询向量
-        query_vector = dense_model.encode_single(query_text)
-
-        # 执行检索
-        search_results = hybrid_searcher.dense_search(query_vector, top_k=top_k)
-
-        # 保存结果
-        results[query_id] = [r.doc_id for r in search_results]
+    # 一次批量 RPC 提交所有查询向量
+    batch_results = hybrid_searcher.dense_search_batch(
+        query_dense_vectors, top_k=top_k, output_fields=ID_OUTPUT_FIELDS
+    )
+    results = {
+        query_item["query_id"]: [r.doc_id for r in search_results]
+        for query_item, search_results in zip(queries, batch_results)
+    }
 
     logger.info(f"Dense 检索完成: {len(results)} 个查询")
     return results
@@ -71,7 +73,7 @@ def milvus_dense_search(
 
 def milvus_sparse_search(
     hybrid_searcher: HybridSearcher,
-    sparse_model: BM25Sparse,
+    query_sparse_vectors: List[Dict[int, float]],
     queries: list,
     top_k: int
 ) -> Dict[str, List[str]]:
@@ -80,20 +82,14 @@ def milvus_sparse_search(
     logger.info("执行 Sparse 向量检索")
     logger.info("=" * 50)
 
-    results = {}
-
-    for query_item in tqdm(queries, desc="Sparse 检索"):
-        query_id = query_item["query_id"]
-        query_text = query_item["query"]
-
-        # 生成稀疏查询向量
-        query_sparse = sparse_model.encode_query(query_text)
-
-        # 执行检索
-        search_results = hybrid_searcher.sparse_search(query_sparse, top_k=top_k)
-
-        # 保存结果
-        results[query_id] = [r.doc_id for r in search_results]
+    # 一次批量 RPC 提交所有预先生成的稀疏查询向量
+    batch_results = hybrid_searcher.sparse_search_batch(
+        query_sparse_vectors, top_k=top_k, output_fields=ID_OUTPUT_FIELDS
+    )
+    results = {
+        query_item["query_id"]: [r.doc_id for r in search_results]
+        for query_item, search_results in zip(queries, batch_results)
+    }
 
     logger.info(f"Sparse 检索完成: {len(results)} 个查询")
     return results
@@ -101,41 +97,35 @@ def milvus_sparse_search(
 
 def milvus_hybrid_search(
     hybrid_searcher: HybridSearcher,
-    dense_model: GLMEmbedding,
-    sparse_model: BM25Sparse,
+    query_dense_vectors: np.ndarray,
+    query_sparse_vectors: List[Dict[int, float]],
     queries: list,
     top_k: int,
     fusion_method: str = "rrf",
     dense_weight: float = 0.6,
-    sparse_weight: float = 0.4
+    sparse_weight: float = 0.4,
+    candidate_k: int = 0
 ) -> Dict[str, List[str]]:
-    """执行混合检索"""
+    """执行混合检索（candidate_k 为每路候选数量，0 表示 top_k * 2）"""
     logger.info("=" * 50)
     logger.info(f"执行混合检索 (融合方法: {fusion_method}, Dense权重: {dense_weight}, Sparse权重: {sparse_weight})")
     logger.info("=" * 50)
 
-    results = {}
-
-    for query_item in tqdm(queries, desc="Hybrid 检索"):
-        query_id = query_item["query_id"]
-        query_text = query_item["query"]
-
-        # 生成查询向量
-        query_dense = dense_model.encode_single(query_text)
-        query_sparse = sparse_model.encode_query(query_text)
-
-        # 执行混合检索
-        search_results = hybrid_searcher.hybrid_search(
-            query_dense=query_dense,
-            query_sparse=query_sparse,
-            top_k=top_k,
-            fusion_method=fusion_method,
-            dense_weight=dense_weight,
-            sparse_weight=sparse_weight
-        )
-
-        # 保存结果
-        results[query_id] = [r.doc_id for r in search_results]
+    # Dense / Sparse 两路各一次批量 RPC 并行执行，随后逐查询融合
+    batch_results = hybrid_searcher.hybrid_search_batch(
+        query_dense_vectors,
+        query_sparse_vectors,
+        top_k=top_k,
+        fusion_method=fusion_method,
+        dense_weight=dense_weight,
+        sparse_weight=sparse_weight,
+        output_fields=ID_OUTPUT_FIELDS,
+        candidate_k=candidate_k
+    )
+    results = {
+        query_item["query_id"]: [r.doc_id for r in search_results]
+        for query_item, search_results in zip(queries, batch_results)
+    }
 
     logger.info(f"混合检索完成: {len(results)} 个查询")
     return results
@@ -151,21 +141,17 @@ def es_bm25_search(
     logger.info("执行 ES BM25 检索")
     logger.info("=" * 50)
 
-    results = {}
-
-    for query_item in tqdm(queries, desc="ES BM25 检索"):
-        query_id = query_item["query_id"]
-        query_text = query_item["query"]
-
-        try:
-            # 执行检索
-            search_results = es_client.search(query_text, top_k=top_k)
+    # 使用 msearch 一次提交所有查询
+    try:
+        batch_results = es_client.search_batch([q["query"] for q in queries], top_k=top_k)
+    except Exception as e:
+        logger.warning(f"ES 检索失败: {e}")
+        batch_results = [[] for _ in queries]
 
-            # 保存结果
-            results[query_id] = [r["doc_id"] for r in search_results]
-        except Exception as e:
-            logger.warning(f"ES 检索失败: {e}")
-            results[query_id] = []
+    results = {
+        query_item["query_id"]: [r["doc_id"] for r in search_results]
+        for query_item, search_results in zip(queries, batch_results)
+    }
 
     logger.info(f"ES BM25 检索完成: {len(results)} 个查询")
     return results
@@ -173,39 +159,35 @@ def es_bm25_search(
 
 def es_mv_hybrid_search(
     es_mv_searcher: ESMVHybridSearcher,
-    dense_model: GLMEmbedding,
+    query_dense_vectors: np.ndarray,
     queries: list,
     top_k: int,
-    fusion_method: str = "rrf"
+    fusion_method: str = "rrf",
+    candidate_k: int = 0
 ) -> Dict[str, List[str]]:
-    """执行 ES + MV 混合检索（应用层融合）"""
+    """执行 ES + MV 混合检索（应用层融合，candidate_k 为每路候选数量，0 表示 top_k * 2）"""
     logger.info("=" * 50)
     logger.info(f"执行 ES + MV 混合检索 (融合方法: {fusion_method})")
     logger.info("=" * 50)
 
-    results = {}
-
-    for query_item in tqdm(queries, desc="ES+MV Hybrid 检索"):
-        query_id = query_item["query_id"]
-        query_text = query_item["query"]
-
-        # 生成 Dense 查询向量
-        query_dense = dense_model.encode_single(query_text)
-
-        try:
-            # 执行混合检索
-            search_results = es_mv_searcher.hybrid_search(
-                query=query_text,
-                query_dense=query_dense,
-                top_k=top_k,
-                fusion_method=fusion_method
-            )
+    # ES 一次 msearch 与 Milvus 一次异步批量检索并行执行，随后逐查询融合
+    try:
+        batch_results = es_mv_searcher.hybrid_search_batch(
+            [q["query"] for q in queries],
+            query_dense_vectors,
+            top_k=top_k,
+            fusion_method=fusion_method,
+            output_fields=ID_OUTPUT_FIELDS,
+            candidate_k=candidate_k
+        )
+    except Exception as e:
+        logger.warning(f"ES+MV 混合检索失败: {e}")
+        batch_results = [[] for _ in queries]
 
-            # 保存结果
-            results[query_id] = [r["doc_id"] for r in search_results]
-        except Exception as e:
-            logger.warning(f"ES+MV 混合检索失败: {e}")
-            results[query_id] = []
+    results = {
+        query_item["query_id"]: [r["doc_id"] for r in search_results]
+        for query_item, search_results in zip(queries, batch_results)
+    }
 
     logger.info(f"ES+MV 混合检索完成: {len(results)} 个查询")
     return results
@@ -224,7 +206,10 @@ def seekdb_hybrid_search(
 
     results = {}
 
-    for query_item in tqdm(queries, desc="SeekDB Hybrid (RRF) 检索"):
+    for query_item in tqdm(
+        queries, desc="SeekDB Hybrid (RRF) 检索",
+        miniters=max(1, len(queries) // 50), mininterval=0.2
+    ):
         query_id = query_item["query_id"]
         query_text = query_item["query"]
 
@@ -246,10 +231,40 @@ def seekdb_hybrid_search(
     return results
 
 
+def load_replay_results(results_path: Path, queries: list) -> Dict[str, Dict[str, List[str]]]:
+    """
+    加载可复用的历史检索结果
+
+    只保留覆盖当前全部查询 ID 的检索方法，其余方法需要重新检索
+
+    Args:
+        results_path: all_results.json 路径
+        queries: 当前查询列表
+
+    Returns:
+        Dict: 检索方法 -> {查询 ID -> 文档 ID 列表}
+    """
+    if not results_path.exists():
+        logger.warning(f"未找到历史检索结果: {results_path}，将执行全部检索")
+        return {}
+
+    with open(results_path, "rb") as f:
+        saved = orjson.loads(f.read())
+
+    query_ids = list(dict.fromkeys(q["query_id"] for q in queries))
+    replayed = {
+        method: {query_id: results[query_id] for query_id in query_ids}
+        for method, results in saved.items()
+        if all(query_id in results for query_id in query_ids)
+    }
+    logger.info(f"--replay: 复用 {len(replayed)} 个检索方法的历史结果: {', '.join(replayed) or '无'}")
+    return replayed
+
+
 def save_results(results: dict, output_path: Path):
     """保存检索结果"""
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    with open(output_path, "wb") as f:
+        f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
     logger.info(f"检索结果已保存: {output_path}")
 
 
@@ -289,12 +304,6 @@ def main():
         logger.info(f"混合查询数量: {len(mixed_queries)}")
         logger.info(f"总查询数量: {len(queries)}")
 
-    # 加载分块数据（用于训练 Sparse 模型）
-    chunks_file = data_dir / "processed" / "chunks.json"
-    logger.info(f"加载分块数据: {chunks_file}")
-    chunks = load_chunks(chunks_file)
-    logger.info(f"分块数量: {len(chunks)}")
-
     # 初始化 Milvus
     logger.info("连接 Milvus...")
     milvus_client = MilvusClient(
@@ -312,19 +321,22 @@ def main():
         sparse_search_field=config.milvus.sparse_vector_field
     )
 
-    # 初始化 Dense 模型
-    logger.info("初始化 GLM Embedding 模型...")
-    dense_model = GLMEmbedding(
-        api_key=config.glm.api_key,
-        model=config.glm.model
-    )
-
     # 初始化 Sparse 模型
+    # 优先加载 02_build_indexes.py 保存的 BM25 模型，避免重新分词训练
     logger.info("初始化 BM25 Sparse 模型...")
-    sparse_model = BM25Sparse(k1=1.5, b=0.75)
-    texts = [chunk["content"] for chunk in chunks]
-    sparse_model.fit(texts)
-    logger.info(f"BM25 模型训练完成，词汇表大小: {sparse_model.get_vocab_size()}")
+    bm25_file = data_dir / "processed" / "bm25.pkl"
+    if bm25_file.exists():
+        sparse_model = BM25Sparse.load(bm25_file)
+    else:
+        logger.warning(f"未找到 BM25 模型文件: {bm25_file}，从分块数据重新训练")
+        chunks_file = data_dir / "processed" / "chunks.jsonl"
+        logger.info(f"加载分块数据: {chunks_file}")
+        chunks = load_chunks(chunks_file)
+        logger.info(f"分块数量: {len(chunks)}")
+        sparse_model = BM25Sparse(k1=1.5, b=0.75)
+        texts = [chunk["content"] for chunk in chunks]
+        sparse_model.fit(texts)
+        logger.info(f"BM25 模型训练完成，词汇表大小: {sparse_model.get_vocab_size()}")
 
     # 初始化 ES 客户端
     es_client = None
@@ -374,61 +386,98 @@ def main():
     else:
         logger.info("跳过 SeekDB 检索（使用 --seekdb 参数启用）")
 
+    # 历史检索结果（--replay），已覆盖的检索方法直接复用
+    replayed = load_replay_results(output_dir / "all_results.json", queries) if "--replay" in sys.argv else {}
+
+    def pending(*methods: str) -> bool:
+        return any(method not in replayed for method in methods)
+
+    # 批量生成 Dense 查询向量（所有 Dense 相关检索共用）
+    # 重复的查询文本（如 test_queries 与 mixed_queries 重叠）只请求一次 API
+    query_texts = [q["query"] for q in queries]
+    query_dense_vectors = None
+    if pending("dense", "hybrid_rrf", "hybrid_weighted") or (es_mv_searcher and pending("es_mv_hybrid_rrf")):
+        # Dense 模型在需要编码时才初始化（维度检测会请求 API，完整复用时无需 GLM 凭证）
+        logger.info("初始化 GLM Embedding 模型...")
+        dense_model = get_glm_embedding(
+            api_key=config.glm.api_key,
+            model=config.glm.model,
+            auto_detect_dim=True,
+            cache_path=config.glm.cache_path
+        )
+        unique_index = {text: i for i, text in enumerate(dict.fromkeys(query_texts))}
+        logger.info(f"正在批量生成 {len(unique_index)} 个唯一查询的 Dense 向量（共 {len(queries)} 个查询）...")
+        unique_dense_vectors = dense_model.encode(list(unique_index), batch_size=config.glm.batch_size)
+        query_dense_vectors = unique_dense_vectors[[unique_index[text] for text in query_texts]]
+
+    # 预先生成 Sparse 查询向量（Sparse 与 Hybrid 检索共用），按查询文本缓存
+    query_sparse_vectors = None
+    if pending("sparse", "hybrid_rrf", "hybrid_weighted"):
+        encode_sparse = lru_cache(maxsize=None)(sparse_model.encode_query)
+        query_sparse_vectors = [encode_sparse(text) for text in query_texts]
+
     # 执行检索
     top_k = config.search.default_top_k
+    candidate_k = config.search.hybrid_search.candidate_k
     all_results = {}
 
+    def run(method: str, search: Callable[[], Dict[str, List[str]]]):
+        if method in replayed:
+            logger.info(f"复用 {method} 的历史检索结果")
+            all_results[method] = replayed[method]
+        else:
+            all_results[method] = search()
+
     # Dense 检索
-    all_results["dense"] = milvus_dense_search(
-        hybrid_searcher, dense_model, queries, top_k
-    )
-    save_results(all_results["dense"], output_dir / "dense_results.json")
+    run("dense", lambda: milvus_dense_search(
+        hybrid_searcher, query_dense_vectors, queries, top_k
+    ))
 
     # Sparse 检索
-    all_results["sparse"] = milvus_sparse_search(
-        hybrid_searcher, sparse_model, queries, top_k
-    )
-    save_results(all_results["sparse"], output_dir / "sparse_results.json")
+    run("sparse", lambda: milvus_sparse_search(
+        hybrid_searcher, query_sparse_vectors, queries, top_k
+    ))
 
     # Hybrid 检索 (RRF)
-    all_results["hybrid_rrf"] = milvus_hybrid_search(
-        hybrid_searcher, dense_model, sparse_model, queries, top_k, fusion_method="rrf"
-    )
-    save_results(all_results["hybrid_rrf"], output_dir / "hybrid_rrf_results.json")
+    run("hybrid_rrf", lambda: milvus_hybrid_search(
+        hybrid_searcher, query_dense_vectors, query_sparse_vectors, queries, top_k, fusion_method="rrf",
+        candidate_k=candidate_k
+    ))
 
     # Hybrid 检索 (Weighted - Dense 优先)
-    all_results["hybrid_weighted"] = milvus_hybrid_search(
-        hybrid_searcher, dense_model, sparse_model, queries, top_k, fusion_method="weighted"
-    )
-    save_results(all_results["hybrid_weighted"], output_dir / "hybrid_weighted_results.json")
+    run("hybrid_weighted", lambda: milvus_hybrid_search(
+        hybrid_searcher, query_dense_vectors, query_sparse_vectors, queries, top_k, fusion_method="weighted",
+        candidate_k=candidate_k
+    ))
 
     # ES BM25 检索
     if es_client:
-        all_results["es_bm25"] = es_bm25_search(
+        run("es_bm25", lambda: es_bm25_search(
             es_client, queries, top_k
-        )
-        save_results(all_results["es_bm25"], output_dir / "es_bm25_results.json")
+        ))
 
     # ES + MV 混合检索 (应用层 RRF 融合)
     if es_mv_searcher:
-        all_results["es_mv_hybrid_rrf"] = es_mv_hybrid_search(
-            es_mv_searcher, dense_model, queries, top_k, fusion_method="rrf"
-        )
-        save_results(all_results["es_mv_hybrid_rrf"], output_dir / "es_mv_hybrid_rrf_results.json")
+        run("es_mv_hybrid_rrf", lambda: es_mv_hybrid_search(
+            es_mv_searcher, query_dense_vectors, queries, top_k, fusion_method="rrf",
+            candidate_k=candidate_k
+        ))
 
     # SeekDB 混合检索（使用内置 RRF 融合）
     if seekdb_searcher:
-        all_results["seekdb_hybrid_rrf"] = seekdb_hybrid_search(
+        run("seekdb_hybrid_rrf", lambda: seekdb_hybrid_search(
             seekdb_searcher, queries, top_k, fusion_method="rrf"
-        )
-        save_results(all_results["seekdb_hybrid_rrf"], output_dir / "seekdb_hybrid_rrf_results.json")
+        ))
 
     # 关闭 ES 连接
     if es_client:
         es_client.close()
 
-    # 保存所有结果
+    # 保存所有结果（默认只写一个合并文件，--split 时额外按检索方法分别保存）
     save_results(all_results, output_dir / "all_results.json")
+    if "--split" in sys.argv:
+        for method, results in all_results.items():
+            save_results(results, output_dir / f"{method}_results.json")
 
     logger.info("=" * 50)
     logger.info("检索完成！")
@@ -5,94 +5,94 @@
 评估各检索方法的效果并生成对比报告
 """
 
-import json
+import os
 import sys
+from operator import itemgetter
 from pathlib import Path
-from typing import Dict, List, Set
-
-# 添加项目根目录到路径
-sys.path.insert(0, str(Path(__file__).parent.parent))
+from typing import Dict, FrozenSet, List, Tuple
 
+import orjson
 from loguru import logger
 from tabulate import tabulate
 
 from src.config.settings import get_config
-from src.evaluation.metrics import Evaluator
+from src.evaluation.metrics import Evaluator, build_doc_index
+
+# 关键指标（排名与报告结论使用）
+KEY_METRICS = ["recall@10", "mrr", "ndcg@10", "map@10"]
 
 
 def load_queries(data_path: Path) -> list:
     """加载查询数据"""
-    with open(data_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(data_path, "rb") as f:
+        return orjson.loads(f.read())
 
 
 def load_results(results_path: Path) -> dict:
     """加载检索结果"""
-    with open(results_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(results_path, "rb") as f:
+        return orjson.loads(f.read())
 
 
-def prepare_relevant_docs(queries: list) -> Dict[str, Set[str]]:
-    """准备相关文档集合"""
+def prepare_relevant_docs(queries: list) -> Dict[str, FrozenSet[str]]:
+    """准备相关文档集合（只读，各方法评估共用）"""
     relevant_docs = {}
     for query_item in queries:
         query_id = query_item["query_id"]
-        relevant_docs[query_id] = set(query_item["relevant_docs"])
+        relevant_docs[query_id] = frozenset(query_item["relevant_docs"])
     return relevant_docs
 
 
-def print_comparison_table(comparison: Dict[str, Dict[str, float]]):
-    """打印对比表格"""
-    # 获取所有指标
-    metrics = []
+def _collect_metrics(comparison: Dict[str, Dict[str, float]]) -> List[str]:
+    """收集所有方法出现过的指标名（排除 query_count），按名称排序"""
+    keys = set()
     for method_results in comparison.values():
-        for key in method_results.keys():
-            if key not in metrics and key != "query_count":
-                metrics.append(key)
-    metrics.sort()
+        keys |= method_results.keys()
+    return sorted(keys - {"query_count"})
+
+
+def _rank_by_metric(
+    comparison: Dict[str, Dict[str, float]],
+    metrics: List[str]
+) -> Dict[str, List[Tuple[str, float]]]:
+    """按指标对方法排序（按值从高到低），返回 指标 -> [(方法名, 值)]"""
+    return {
+        metric: sorted(
+            ((method_name, results.get(metric, 0)) for method_name, results in comparison.items()),
+            key=itemgetter(1),
+            reverse=True
+        )
+        for metric in metrics
+    }
 
+
+def print_comparison_table(comparison: Dict[str, Dict[str, float]], metrics: List[str]):
+    """打印对比表格"""
     # 构建表格数据
     headers = ["方法"] + metrics
-    rows = []
-
-    for method_name, method_results in comparison.items():
-        row = [method_name]
-        for metric in metrics:
-            value = method_results.get(metric, 0.0)
-            if isinstance(value, float):
-                row.append(f"{value:.4f}")
-            else:
-                row.append(str(value))
-        rows.append(row)
+    # 保留原始数值，由 tabulate 按 floatfmt 统一格式化浮点列
+    rows = [
+        [method_name] + [method_results.get(metric, 0.0) for metric in metrics]
+        for method_name, method_results in comparison.items()
+    ]
 
     print("\n" + "=" * 80)
     print("检索效果对比表")
     print("=" * 80)
-    print(tabulate(rows, headers=headers, tablefmt="grid"))
+    print(tabulate(rows, headers=headers, tablefmt="grid", floatfmt=".4f"))
     print("=" * 80 + "\n")
 
 
-def print_ranking(comparison: Dict[str, Dict[str, float]]):
+def print_ranking(rankings: Dict[str, List[Tuple[str, float]]]):
     """打印各指标排名"""
     print("\n" + "=" * 80)
     print("各指标排名（按值从高到低）")
     print("=" * 80 + "\n")
 
-    # 关键指标
-    key_metrics = ["recall@10", "mrr", "ndcg@10", "map@10"]
-
-    for metric in key_metrics:
+    for metric, sorted_methods in rankings.items():
         print(f"【{metric.upper()}】")
 
-        # 排序
-        sorted_methods = sorted(
-            comparison.items(),
-            key=lambda x: x[1].get(metric, 0),
-            reverse=True
-        )
-
-        for rank, (method_name, results) in enumerate(sorted_methods, 1):
-            value = results.get(metric, 0)
+        for rank, (method_name, value) in enumerate(sorted_methods, 1):
             medal = "🥇" if rank == 1 else "🥈" if rank == 2 else "🥉" if rank == 3 else "  "
             print(f"  {medal} {rank}. {method_name:20s} {value:.4f}")
 
@@ -101,36 +101,11 @@ def print_ranking(comparison: Dict[str, Dict[str, float]]):
 
 def generate_markdown_report(
     comparison: Dict[str, Dict[str, float]],
+    metrics: List[str],
+    rankings: Dict[str, List[Tuple[str, float]]],
     output_path: Path
 ):
-    """生成 Markdown 报告"""
-    report_lines = []
-
-    report_lines.append("# Milvus 多路检索验证报告\n")
-    report_lines.append("## 评估结果对比\n")
-
-    # 表格
-    metrics = []
-    for method_results in comparison.values():
-        for key in method_results.keys():
-            if key not in metrics and key != "query_count":
-                metrics.append(key)
-    metrics.sort()
-
-    # Markdown 表格
-    report_lines.append("| 方法 | " + " | ".join(metrics) + " |")
-    report_lines.append("|" + "--|" * (len(metrics) + 1))
-
-    for method_name, method_results in comparison.items():
-        row_values = [f"{method_results.get(m, 0):.4f}" for m in metrics]
-        report_lines.append(f"| {method_name} | " + " | ".join(row_values) + " |")
-
-    report_lines.append("\n## 结论\n")
-
-    # 分析
-    report_lines.append("### 关键指标分析\n")
-
-    key_metrics = ["recall@10", "mrr", "ndcg@10", "map@10"]
+    """生成 Markdown 报告（逐行写入文件）"""
     metric_descriptions = {
         "recall@10": "召回率@10 - 前 10 个结果中相关文档的覆盖程度",
         "mrr": "平均倒数排名 - 首个相关文档的平均排名质量",
@@ -138,31 +113,42 @@ def generate_markdown_report(
         "map@10": "平均精度均值@10 - 整体检索质量"
     }
 
-    for metric in key_metrics:
-        sorted_methods = sorted(
-            comparison.items(),
-            key=lambda x: x[1].get(metric, 0),
-            reverse=True
-        )
-        best_method = sorted_methods[0][0]
-        best_value = sorted_methods[0][1].get(metric, 0)
+    with open(output_path, "w", encoding="utf-8", buffering=1 << 16) as f:
+        write = f.write
 
-        report_lines.append(f"#### {metric.upper()}")
-        report_lines.append(f"- **描述**: {metric_descriptions.get(metric, '')}")
-        report_lines.append(f"- **最佳方法**: {best_method} ({best_value:.4f})")
-        report_lines.append("")
+        write("# Milvus 多路检索验证报告\n\n")
+        write("## 评估结果对比\n\n")
 
-    # 写入文件
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(report_lines))
+        # Markdown 表格
+        write("| 方法 | " + " | ".join(metrics) + " |\n")
+        write("|" + "--|" * (len(metrics) + 1) + "\n")
+
+        for method_name, method_results in comparison.items():
+            row_values = " | ".join([f"{method_results.get(m, 0):.4f}" for m in metrics])
+            write(f"| {method_name} | {row_values} |\n")
+
+        write("\n## 结论\n\n")
+
+        # 分析
+        write("### 关键指标分析\n\n")
+
+        for i, (metric, sorted_methods) in enumerate(rankings.items()):
+            best_method, best_value = sorted_methods[0]
+
+            # 各指标小节之间空一行
+            if i:
+                write("\n")
+            write(f"#### {metric.upper()}\n")
+            write(f"- **描述**: {metric_descriptions.get(metric, '')}\n")
+            write(f"- **最佳方法**: {best_method} ({best_value:.4f})\n")
 
     logger.info(f"Markdown 报告已保存: {output_path}")
 
 
 def save_comparison_json(comparison: dict, output_path: Path):
     """保存对比结果为 JSON"""
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(comparison, f, ensure_ascii=False, indent=2)
+    with open(output_path, "wb") as f:
+        f.write(orjson.dumps(comparison, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
     logger.info(f"对比结果已保存: {output_path}")
 
 
@@ -203,8 +189,9 @@ def main():
         logger.info(f"混合查询数量: {len(mixed_queries)}")
         logger.info(f"总查询数量: {len(queries)}")
 
-    # 准备相关文档集合
+    # 准备相关文档集合，并为相关文档分配整数 ID（各方法评估共用）
     relevant_docs = prepare_relevant_docs(queries)
+    doc2id = build_doc_index(relevant_docs.values())
 
     # 加载检索结果
     all_results_file = results_dir / "all_results.json"
@@ -219,18 +206,27 @@ def main():
     logger.info("开始评估各检索方法")
     logger.info("=" * 50)
 
-    comparison = evaluator.compare_results(all_results, relevant_docs)
+    # --parallel: 按方法多进程并行评估
+    max_workers = os.cpu_count() if "--parallel" in sys.argv else None
+    comparison = evaluator.compare_results(
+        all_results, relevant_docs, doc2id=doc2id, max_workers=max_workers
+    )
+
+    # 汇总指标名（表格与报告共用）
+    metrics = _collect_metrics(comparison)
 
     # 打印结果
-    print_comparison_table(comparison)
-    print_ranking(comparison)
+    rankings = _rank_by_metric(comparison, KEY_METRICS)
+
+    print_comparison_table(comparison, metrics)
+    print_ranking(rankings)
 
     # 保存结果
     json_file = reports_dir / "comparison_results.json"
     save_comparison_json(comparison, json_file)
 
     md_file = reports_dir / "evaluation_report.md"
-    generate_markdown_report(comparison, md_file)
+    generate_markdown_report(comparison, metrics, rankings, md_file)
 
     logger.info("=" * 50)
     logger.info("评估完成！")
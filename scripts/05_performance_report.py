@@ -3,9 +3,12 @@
 性能报告生成 - 基于已有结果数据
 """
 
-import json
+import sys
+from operator import itemgetter
 from pathlib import Path
 
+import orjson
+
 
 def main():
     # 读取评估结果
@@ -13,72 +16,53 @@ def main():
     comparison_path = Path("outputs/reports/comparison_results.json")
 
     if comparison_path.exists():
-        with open(comparison_path) as f:
-            data = json.load(f)
+        with open(comparison_path, "rb") as f:
+            data = orjson.loads(f.read())
 
         print("=" * 70)
         print("性能数据对比报告")
         print("=" * 70)
 
-        # 1. 准确率对比
-        print("\n【准确率对比】NDCG@10 (越高越好)")
-        print("-" * 70)
-
-        ndcg_scores = []
-        for method, metrics in data.items():
-            if method != "es_bm25":  # 排除失败的 ES BM25
-                ndcg_scores.append((method, metrics["ndcg@10"]))
-
-        for method, score in sorted(ndcg_scores, key=lambda x: -x[1]):
-            print(f"  {method:25s}: {score:.4f}")
-
-        # 2. 召回率对比
-        print("\n【召回率对比】Recall@10 (越高越好)")
-        print("-" * 70)
-
-        recall_scores = []
-        for method, metrics in data.items():
-            if method != "es_bm25":
-                recall_scores.append((method, metrics["recall@10"]))
-
-        for method, score in sorted(recall_scores, key=lambda x: -x[1]):
-            print(f"  {method:25s}: {score:.4f}")
-
-        # 3. MRR 对比
-        print("\n【排名质量对比】MRR (越高越好)")
-        print("-" * 70)
-
-        mrr_scores = []
-        for method, metrics in data.items():
-            if method != "es_bm25":
-                mrr_scores.append((method, metrics["mrr"]))
-
-        for method, score in sorted(mrr_scores, key=lambda x: -x[1]):
-            print(f"  {method:25s}: {score:.4f}")
+        # 各方法指标只提取一次: (方法, NDCG@10, Recall@10, MRR, MAP@10)
+        rows = [
+            (method, metrics["ndcg@10"], metrics["recall@10"], metrics["mrr"], metrics["map@10"])
+            for method, metrics in data.items()
+            if method != "es_bm25"  # 排除失败的 ES BM25
+        ]
+        by_ndcg = sorted(rows, key=itemgetter(1), reverse=True)
+        # 综合对比表与 NDCG 排名共用同一次排序
+        rankings = [
+            (1, "\n【准确率对比】NDCG@10 (越高越好)", by_ndcg),
+            (2, "\n【召回率对比】Recall@10 (越高越好)", sorted(rows, key=itemgetter(2), reverse=True)),
+            (3, "\n【排名质量对比】MRR (越高越好)", sorted(rows, key=itemgetter(3), reverse=True)),
+        ]
+
+        # 1-3. 准确率 / 召回率 / MRR 对比
+        for col, title, ranked in rankings:
+            print(title)
+            print("-" * 70)
+            sys.stdout.write("".join(f"  {row[0]:25s}: {row[col]:.4f}\n" for row in ranked))
 
         # 4. 综合对比表
         print("\n【综合性能对比表】")
         print("-" * 70)
         print(f"{'方法':<22} {'NDCG@10':<10} {'Recall@10':<10} {'MRR':<10} {'MAP@10':<10}")
         print("-" * 70)
-
-        for method, metrics in sorted(data.items(), key=lambda x: -x[1]["ndcg@10"]):
-            if method == "es_bm25":
-                continue
-            print(f"{method:<22} {metrics['ndcg@10']:<10.4f} {metrics['recall@10']:<10.4f} {metrics['mrr']:<10.4f} {metrics['map@10']:<10.4f}")
+        sys.stdout.write("".join(
+            f"{method:<22} {ndcg:<10.4f} {recall:<10.4f} {mrr:<10.4f} {map10:<10.4f}\n"
+            for method, ndcg, recall, mrr, map10 in by_ndcg
+        ))
 
         # 5. 性能分析
         print("\n【关键发现】")
         print("-" * 70)
 
-        # 找出最佳方法
-        best_ndcg = max(ndcg_scores, key=lambda x: x[1])
-        best_recall = max(recall_scores, key=lambda x: x[1])
-        best_mrr = max(mrr_scores, key=lambda x: x[1])
-
-        print(f"  最佳 NDCG@10    : {best_ndcg[0]} ({best_ndcg[1]:.4f})")
-        print(f"  最佳 Recall@10  : {best_recall[0]} ({best_recall[1]:.4f})")
-        print(f"  最佳 MRR        : {best_mrr[0]} ({best_mrr[1]:.4f})")
+        # 找出最佳方法（各排名的首项）
+        if rows:
+            labels = ("NDCG@10    ", "Recall@10  ", "MRR        ")
+            for label, (col, _, ranked) in zip(labels, rankings):
+                best = ranked[0]
+                print(f"  最佳 {label}: {best[0]} ({best[col]:.4f})")
 
         # RRF vs Weighted 对比
         print("\n【融合算法对比】(使用相同 GLM 2048维向量)")
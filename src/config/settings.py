@@ -2,24 +2,30 @@
 配置管理模块
 """
 
+import json
 import os
+import re
+from dataclasses import dataclass, field, fields, is_dataclass
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
 import yaml
 from dotenv import load_dotenv
-from pydantic import BaseModel, Field
 
 
-class GLMConfig(BaseModel):
+@dataclass(slots=True, frozen=True)
+class GLMConfig:
     """GLM Embedding 配置"""
     api_key: str
     model: str = "embedding-3"
     dimension: int = 1024
     batch_size: int = 10
+    cache_path: str = ""  # 向量缓存（SQLite）路径，为空时不缓存
 
 
-class MilvusConfig(BaseModel):
+@dataclass(slots=True, frozen=True)
+class MilvusConfig:
     """Milvus 配置"""
     uri: str = "milvus_lite.db"
     collection_name: str = "doc_chunks"
@@ -27,7 +33,8 @@ class MilvusConfig(BaseModel):
     sparse_vector_field: str = "sparse_vector"
 
 
-class ESConfig(BaseModel):
+@dataclass(slots=True, frozen=True)
+class ESConfig:
     """Elasticsearch 配置"""
     host: str = "localhost"
     port: int = 9200
@@ -37,7 +44,8 @@ class ESConfig(BaseModel):
     verify_certs: bool = False
 
 
-class SeekDBConfig(BaseModel):
+@dataclass(slots=True, frozen=True)
+class SeekDBConfig:
     """OceanBase SeekDB 配置"""
     # 服务器模式配置
     use_server: bool = False
@@ -54,7 +62,8 @@ class SeekDBConfig(BaseModel):
     embedding_function: str = "default"
 
 
-class ChunkingConfig(BaseModel):
+@dataclass(slots=True, frozen=True)
+class ChunkingConfig:
     """文档分块配置"""
     chunk_size: int = 512
     chunk_overlap: int = 50
@@ -62,41 +71,48 @@ class ChunkingConfig(BaseModel):
     separator: str = "\n\n"
 
 
-class DenseSearchConfig(BaseModel):
+@dataclass(slots=True, frozen=True)
+class DenseSearchConfig:
     """Dense 检索配置"""
     ef: int = 256
     metric_type: str = "IP"
 
 
-class SparseSearchConfig(BaseModel):
+@dataclass(slots=True, frozen=True)
+class SparseSearchConfig:
     """Sparse 检索配置"""
     drop_ratio: float = 0.1
     metric_type: str = "IP"
 
 
-class HybridSearchConfig(BaseModel):
+@dataclass(slots=True, frozen=True)
+class HybridSearchConfig:
     """混合检索配置"""
     fusion_method: str = "rrf"  # "rrf" or "weighted"
     rrf_k: int = 60
     dense_weight: float = 0.5
     sparse_weight: float = 0.5
+    candidate_k: int = 0  # 每路拉取的候选数量，0 表示 top_k * 2
 
 
-class SearchConfig(BaseModel):
+@dataclass(slots=True, frozen=True)
+class SearchConfig:
     """检索配置"""
     default_top_k: int = 10
-    dense_search: DenseSearchConfig = Field(default_factory=DenseSearchConfig)
-    sparse_search: SparseSearchConfig = Field(default_factory=SparseSearchConfig)
-    hybrid_search: HybridSearchConfig = Field(default_factory=HybridSearchConfig)
+    dense_search: DenseSearchConfig = field(default_factory=DenseSearchConfig)
+    sparse_search: SparseSearchConfig = field(default_factory=SparseSearchConfig)
+    hybrid_search: HybridSearchConfig = field(default_factory=HybridSearchConfig)
 
 
-class EvaluationConfig(BaseModel):
+@dataclass(slots=True, frozen=True)
+class EvaluationConfig:
     """评估配置"""
-    k_values: list = Field(default_factory=lambda: [1, 3, 5, 10])
-    metrics: list = Field(default_factory=lambda: ["recall", "precision", "mrr", "ndcg", "map"])
+    k_values: list = field(default_factory=lambda: [1, 3, 5, 10])
+    metrics: list = field(default_factory=lambda: ["recall", "precision", "mrr", "ndcg", "map"])
 
 
-class LoggingConfig(BaseModel):
+@dataclass(slots=True, frozen=True)
+class LoggingConfig:
     """日志配置"""
     level: str = "INFO"
     file: str = "outputs/logs/app.log"
@@ -104,64 +120,107 @@ class LoggingConfig(BaseModel):
     retention: str = "7 days"
 
 
-class Config(BaseModel):
+@dataclass(slots=True, frozen=True)
+class Config:
     """全局配置"""
     project: dict
     glm: GLMConfig
-    milvus: MilvusConfig = Field(default_factory=MilvusConfig)
-    elasticsearch: ESConfig = Field(default_factory=ESConfig)
-    seekdb: SeekDBConfig = Field(default_factory=SeekDBConfig)
-    chunking: ChunkingConfig = Field(default_factory=ChunkingConfig)
-    search: SearchConfig = Field(default_factory=SearchConfig)
-    evaluation: EvaluationConfig = Field(default_factory=EvaluationConfig)
-    logging: LoggingConfig = Field(default_factory=LoggingConfig)
-
-    class Config:
-        arbitrary_types_allowed = True
+    milvus: MilvusConfig = field(default_factory=MilvusConfig)
+    elasticsearch: ESConfig = field(default_factory=ESConfig)
+    seekdb: SeekDBConfig = field(default_factory=SeekDBConfig)
+    chunking: ChunkingConfig = field(default_factory=ChunkingConfig)
+    search: SearchConfig = field(default_factory=SearchConfig)
+    evaluation: EvaluationConfig = field(default_factory=EvaluationConfig)
+    logging: LoggingConfig = field(default_factory=LoggingConfig)
 
 
 # 项目根目录
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 
+# 优先使用 LibYAML 的 C 实现解析 YAML
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# ${VAR_NAME} 格式的环境变量占位符
+_ENV_RE = re.compile(r"\$\{([A-Za-z_][A-Za-z0-9_]*)\}")
+
+
+def _replace_env_var(match: re.Match) -> str:
+    """
+    替换单个环境变量占位符，未设置的变量保持原样
+
+    占位符应写在双引号字符串中（如 api_key: "${GLM_API_KEY}"），
+    替换值按 YAML 双引号字符串规则转义，避免值中的引号或反斜杠破坏 YAML 结构
+    """
+    value = os.environ.get(match.group(1))
+    if value is None:
+        return match.group(0)
+    return json.dumps(value, ensure_ascii=False)[1:-1]
+
+
+def _coerce_scalar(target_type: type, value):
+    """将 YAML 标量（如环境变量替换得到的字符串）转换为字段声明的类型"""
+    if target_type is bool and isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ("true", "yes", "on", "1"):
+            return True
+        if lowered in ("false", "no", "off", "0"):
+            return False
+        raise ValueError(f"无法将 {value!r} 转换为 bool")
+    return target_type(value)
+
+
+def _from_dict(cls: type, data: dict):
+    """
+    由配置字典构建配置对象
+
+    嵌套配置递归构建，未声明的键忽略，str/int/float/bool 字段按声明类型转换
+    """
+    kwargs = {}
+    for f in fields(cls):
+        if f.name not in data:
+            continue
+        value = data[f.name]
+        if is_dataclass(f.type):
+            if isinstance(value, dict):
+                value = _from_dict(f.type, value)
+        elif f.type in (str, int, float, bool) and value is not None and type(value) is not f.type:
+            value = _coerce_scalar(f.type, value)
+        kwargs[f.name] = value
+    return cls(**kwargs)
+
 
 def load_config(config_path: Optional[str] = None) -> Config:
     """
     加载配置文件
 
+    同一路径的配置在进程内只解析一次
+
     Args:
         config_path: 配置文件路径，默认为项目根目录下的 config.yaml
 
     Returns:
         Config: 配置对象
     """
-    # 加载环境变量
-    load_dotenv()
-
     # 默认配置文件路径
     if config_path is None:
         config_path = PROJECT_ROOT / "config.yaml"
 
-    # 读取 YAML 配置
+    return _load_config_cached(str(Path(config_path).resolve()))
+
+
+@lru_cache(maxsize=8)
+def _load_config_cached(config_path: str) -> Config:
+    """按配置文件绝对路径缓存解析结果"""
+    # 加载环境变量
+    load_dotenv()
+
+    # 读取 YAML 配置，解析前在原始文本上一次性替换环境变量
     with open(config_path, "r", encoding="utf-8") as f:
-        config_data = yaml.safe_load(f)
-
-    # 替换环境变量
-    def replace_env(obj):
-        if isinstance(obj, str):
-            # 替换 ${VAR_NAME} 格式的环境变量
-            if obj.startswith("${") and obj.endswith("}"):
-                var_name = obj[2:-1]
-                return os.getenv(var_name, obj)
-            return obj
-        elif isinstance(obj, dict):
-            return {k: replace_env(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [replace_env(item) for item in obj]
-        return obj
-
-    config_data = replace_env(config_data)
-
-    return Config(**config_data)
+        config_text = _ENV_RE.sub(_replace_env_var, f.read())
+
+    config_data = yaml.load(config_text, Loader=_YAML_LOADER)
+
+    return _from_dict(Config, config_data)
 
 
 # 全局配置实例
@@ -2,13 +2,43 @@
 Elasticsearch 客户端封装
 """
 
-from typing import List, Dict, Optional
-
-from elasticsearch import Elasticsearch
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import orjson
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+from elasticsearch.helpers import async_bulk, bulk, parallel_bulk
 from loguru import logger
 
 from .schemas import get_es_mapping
 
+# 检索结果需要的 _source 字段
+SOURCE_FIELDS = ["doc_id", "chunk_id", "title", "content"]
+
+# bulk 请求超时（秒），大批量写入时默认超时偏短
+BULK_REQUEST_TIMEOUT = 120
+
+# 查询体模板中查询文本的占位符：模板按 top_k 用 orjson 序列化一次并在占位符处切分，
+# msearch 时每个查询只需序列化查询文本本身再拼接
+_QUERY_PLACEHOLDER = "\x00query\x00"
+
+
+def _bulk_action(index_name: str, doc: Dict) -> Dict:
+    """构建单条 bulk index action，文档 ID 优先取 id，其次 chunk_id"""
+    return {
+        "_index": index_name,
+        "_id": doc.get("id", doc.get("chunk_id")),
+        "_source": doc
+    }
+
+
+def _iter_actions(index_name: str, documents: Iterable[Dict]) -> Iterator[Dict]:
+    """逐条生成 bulk action，bulk 按块消费，无需一次性构建全部 action（同步 / 异步客户端共用）"""
+    for doc in documents:
+        yield _bulk_action(index_name, doc)
+
 
 class ESClient:
     """Elasticsearch 客户端封装"""
@@ -20,7 +50,10 @@ class ESClient:
         index_name: str = "doc_chunks",
         username: str = "",
         password: str = "",
-        verify_certs: bool = False
+        verify_certs: bool = False,
+        bulk_chunk_size: int = 1000,
+        bulk_max_chunk_bytes: int = 10 * 1024 * 1024,
+        bulk_thread_count: int = 4
     ):
         """
         初始化 ES 客户端
@@ -32,10 +65,16 @@ class ESClient:
             username: 用户名
             password: 密码
             verify_certs: 是否验证证书
+            bulk_chunk_size: 批量写入时每个请求的文档数
+            bulk_max_chunk_bytes: 批量写入时每个请求的最大字节数
+            bulk_thread_count: 并行批量写入的线程数
         """
         self.host = host
         self.port = port
         self.index_name = index_name
+        self.bulk_chunk_size = bulk_chunk_size
+        self.bulk_max_chunk_bytes = bulk_max_chunk_bytes
+        self.bulk_thread_count = bulk_thread_count
 
         # 构建连接配置
         if username and password:
@@ -56,13 +95,19 @@ class ESClient:
         else:
             logger.warning(f"无法连接到 Elasticsearch: {host}:{port}")
 
-    def create_index(self, drop_existing: bool = False, use_ik_analyzer: bool = False) -> bool:
+    def create_index(
+        self,
+        drop_existing: bool = False,
+        use_ik_analyzer: bool = False,
+        bulk_ingest: bool = False
+    ) -> bool:
         """
         创建索引
 
         Args:
             drop_existing: 如果索引已存在是否删除
             use_ik_analyzer: 是否使用 IK 中文分词器
+            bulk_ingest: 是否以批量导入设置创建（导入后由 bulk_load_settings 恢复 translog 持久化）
 
         Returns:
             bool: 是否创建成功
@@ -77,7 +122,7 @@ class ESClient:
                 return True
 
         # 获取 Mapping
-        mapping = get_es_mapping(use_ik_analyzer=use_ik_analyzer)
+        mapping = get_es_mapping(use_ik_analyzer=use_ik_analyzer, bulk_ingest=bulk_ingest)
 
         # 创建索引 (ES v8.x API)
         self.client.indices.create(
@@ -88,40 +133,95 @@ class ESClient:
 
         return True
 
-    def insert_documents(self, documents: List[Dict]) -> int:
+    def insert_documents(self, documents: List[Dict], thread_count: Optional[int] = None) -> int:
         """
         批量插入文档
 
+        使用 parallel_bulk 多线程提交 bulk 请求，各线程共用同一个 ES 客户端的连接池
+
         Args:
             documents: 文档列表
+            thread_count: 并行线程数，默认使用 bulk_thread_count
 
         Returns:
             int: 插入的文档数量
         """
-        from elasticsearch.helpers import bulk
-
-        actions = []
-        for doc in documents:
-            action = {
-                "_index": self.index_name,
-                "_id": doc.get("id", doc.get("chunk_id")),
-                "_source": doc
-            }
-            actions.append(action)
-
-        success_count, failed_items = bulk(
-            self.client,
-            actions,
+        thread_count = thread_count or self.bulk_thread_count
+
+        # 只计数，不保留逐条响应；失败时仅记录第一条作为示例
+        success_count = 0
+        failed_count = 0
+        first_error = None
+        for ok, item in parallel_bulk(
+            self.client.options(request_timeout=BULK_REQUEST_TIMEOUT),
+            _iter_actions(self.index_name, documents),
+            thread_count=thread_count,
+            queue_size=thread_count,
+            chunk_size=self.bulk_chunk_size,
+            max_chunk_bytes=self.bulk_max_chunk_bytes,
             raise_on_error=False
-        )
+        ):
+            if ok:
+                success_count += 1
+            else:
+                failed_count += 1
+                if first_error is None:
+                    first_error = item
 
         logger.info(f"已插入 {success_count} 条文档到 ES")
 
-        if failed_items:
-            logger.warning(f"有 {len(failed_items)} 条文档插入失败")
+        if failed_count:
+            logger.warning(f"有 {failed_count} 条文档插入失败, 示例: {first_error}")
 
         return success_count
 
+    @contextmanager
+    def bulk_load_settings(self, restore_refresh_interval: str = "30s", force_merge: bool = True):
+        """
+        批量导入期间临时关闭刷新与副本
+
+        进入时设置 refresh_interval=-1、number_of_replicas=0；退出时（无论导入是否出错）先恢复副本数与
+        translog 同步落盘，并将 refresh_interval 设为 restore_refresh_interval 后刷新一次使文档可检索；
+        导入成功时再可选合并段，合并失败只记录日志
+
+        Args:
+            restore_refresh_interval: 导入结束后的刷新间隔
+            force_merge: 导入成功后是否合并为单个段
+        """
+        settings = self.client.indices.get_settings(index=self.index_name)
+        index_settings = settings[self.index_name]["settings"]["index"]
+        original_replicas = index_settings.get("number_of_replicas", "1")
+
+        self.client.indices.put_settings(
+            index=self.index_name,
+            settings={"index": {"refresh_interval": "-1", "number_of_replicas": 0}}
+        )
+        logger.info(f"已关闭索引刷新与副本: {self.index_name}")
+
+        try:
+            yield self
+        finally:
+            self.client.indices.put_settings(
+                index=self.index_name,
+                settings={
+                    "index": {
+                        "refresh_interval": restore_refresh_interval,
+                        "number_of_replicas": original_replicas,
+                        "translog.durability": "request"
+                    }
+                }
+            )
+            self.client.indices.refresh(index=self.index_name)
+            logger.info(f"已恢复索引设置: refresh_interval={restore_refresh_interval}, replicas={original_replicas}")
+
+        # 只在导入成功时合并段（导入出错时异常已在上方恢复设置后抛出）
+        if force_merge:
+            try:
+                self.client.indices.forcemerge(index=self.index_name, max_num_segments=1)
+                logger.info(f"已合并索引段: {self.index_name}")
+            except Exception as e:
+                logger.warning(f"索引段合并失败: {e}")
+
     def search(self, query: str, top_k: int = 10) -> List[Dict]:
         """
         执行 BM25 检索
@@ -133,7 +233,44 @@ class ESClient:
         Returns:
             List[Dict]: 检索结果
         """
-        query_body = {
+        query_body = self._build_query_body(query, top_k)
+
+        response = self.client.search(index=self.index_name, body=query_body)
+
+        return self._parse_hits(response)
+
+    def search_batch(self, queries: List[str], top_k: int = 10) -> List[List[Dict]]:
+        """
+        使用 msearch 批量执行 BM25 检索
+
+        一次 HTTP 请求提交所有查询，单个查询出错时该查询返回空列表
+
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回结果数量
+
+        Returns:
+            List[List[Dict]]: 与查询顺序一致的检索结果列表
+        """
+        if not queries:
+            return []
+
+        response = self.client.msearch(searches=self._build_msearch_body(self.index_name, queries, top_k))
+
+        results = []
+        for query, item in zip(queries, response["responses"]):
+            if "error" in item:
+                logger.warning(f"ES msearch 查询失败: {query[:50]}, 错误: {item['error']}")
+                results.append([])
+            else:
+                results.append(self._parse_hits(item))
+
+        return results
+
+    @staticmethod
+    def _build_query_body(query: str, top_k: int) -> dict:
+        """构建 BM25 查询体（标题权重 2.0，内容权重 1.0）"""
+        return {
             "query": {
                 "bool": {
                     "should": [
@@ -156,28 +293,63 @@ class ESClient:
                     ]
                 }
             },
-            "size": top_k
+            "size": top_k,
+            # 只返回结果中用到的字段
+            "_source": SOURCE_FIELDS
         }
 
-        response = self.client.search(index=self.index_name, body=query_body)
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def _query_body_template(top_k: int) -> Tuple[bytes, ...]:
+        """orjson 序列化后在查询文本占位符处切分的查询体片段（按 top_k 缓存）"""
+        body = orjson.dumps(ESClient._build_query_body(_QUERY_PLACEHOLDER, top_k))
+        return tuple(body.split(orjson.dumps(_QUERY_PLACEHOLDER)))
 
-        results = []
-        for hit in response["hits"]["hits"]:
-            results.append({
-                "doc_id": hit["_source"].get("doc_id"),
-                "chunk_id": hit["_source"].get("chunk_id"),
-                "title": hit["_source"].get("title"),
-                "content": hit["_source"].get("content"),
-                "score": hit["_score"]
-            })
+    @staticmethod
+    def _build_msearch_body(index_name: str, queries: List[str], top_k: int) -> bytes:
+        """
+        构建预序列化的 msearch NDJSON 请求体
 
-        return results
+        header 与查询体模板只序列化一次，每个查询只用 orjson 序列化查询文本并拼接，
+        elasticsearch 客户端对 bytes 请求体直接发送，不再逐行 JSON 序列化
+
+        Args:
+            index_name: 索引名称
+            queries: 查询文本列表
+            top_k: 每个查询返回结果数量
+
+        Returns:
+            bytes: 以换行结尾的 NDJSON 请求体
+        """
+        header = orjson.dumps({"index": index_name})
+        parts = ESClient._query_body_template(top_k)
+        lines = []
+        for query in queries:
+            lines.append(header)
+            lines.append(orjson.dumps(query).join(parts))
+        lines.append(b"")
+        return b"\n".join(lines)
+
+    @staticmethod
+    def _parse_hits(response) -> List[Dict]:
+        """将 ES 响应转换为结果列表"""
+        return [
+            {
+                "doc_id": source.get("doc_id"),
+                "chunk_id": source.get("chunk_id"),
+                "title": source.get("title"),
+                "content": source.get("content"),
+                "score": hit["_score"]
+            }
+            for hit in response["hits"]["hits"]
+            for source in (hit["_source"],)
+        ]
 
     def get_stats(self) -> dict:
         """获取索引统计信息"""
         try:
-            stats = self.client.indices.stats(index=self.index_name)
-            doc_count = stats["indices"][self.index_name]["primaries"]["docs"]["count"]
+            # _count 只返回文档数，响应远小于 indices.stats
+            doc_count = self.client.count(index=self.index_name)["count"]
             return {
                 "index_name": self.index_name,
                 "doc_count": doc_count
@@ -195,12 +367,274 @@ class ESClient:
             self.client.indices.delete(index=self.index_name)
             logger.info(f"已删除索引: {self.index_name}")
 
+    def bulk_queue(self, **kwargs) -> "ESBulkQueue":
+        """
+        创建写入当前索引的自适应批量写入队列
+
+        Args:
+            **kwargs: 传给 ESBulkQueue 的参数，默认使用客户端的 bulk_chunk_size / bulk_max_chunk_bytes
+
+        Returns:
+            ESBulkQueue: 批量写入队列
+        """
+        kwargs.setdefault("chunk_size", self.bulk_chunk_size)
+        kwargs.setdefault("max_chunk_bytes", self.bulk_max_chunk_bytes)
+        return ESBulkQueue(self.client, self.index_name, **kwargs)
+
     def close(self):
         """关闭客户端"""
         self.client.close()
         logger.info("已关闭 ES 连接")
 
 
+class ESBulkQueue:
+    """
+    自适应批量写入队列
+
+    文档数达到 chunk_size 或累计字节数达到 max_chunk_bytes 时提交一次 bulk。
+    每批提交后按耗时以 AIMD 调整 chunk_size：耗时低于 target_seconds 时增加 10%，
+    超过 slow_seconds 或出现 429（ES 拒绝写入）时减半
+    """
+
+    def __init__(
+        self,
+        client: Elasticsearch,
+        index_name: str,
+        chunk_size: int = 1000,
+        max_chunk_bytes: int = 10 * 1024 * 1024,
+        min_chunk_size: int = 100,
+        max_chunk_size: int = 10000,
+        target_seconds: float = 2.0,
+        slow_seconds: float = 5.0
+    ):
+        """
+        初始化批量写入队列
+
+        Args:
+            client: ES 客户端
+            index_name: 索引名称
+            chunk_size: 初始每批文档数
+            max_chunk_bytes: 每批最大字节数（建议 5-15MB，远低于 ES 100MB 的请求上限）
+            min_chunk_size: 每批文档数下限
+            max_chunk_size: 每批文档数上限
+            target_seconds: 单批耗时低于该值时增大批量
+            slow_seconds: 单批耗时超过该值时减小批量
+        """
+        self.client = client
+        self.index_name = index_name
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.target_seconds = target_seconds
+        self.slow_seconds = slow_seconds
+
+        self.success_count = 0
+        self.failed_items: List[Dict] = []
+        self._buffer: List[Dict] = []
+        self._buffer_bytes = 0
+
+    def add(self, doc: Dict):
+        """加入一条文档，达到数量或字节阈值时提交当前缓冲"""
+        doc_bytes = len(orjson.dumps(doc))
+        if self._buffer and (
+            len(self._buffer) >= self.chunk_size
+            or self._buffer_bytes + doc_bytes > self.max_chunk_bytes
+        ):
+            self.flush()
+
+        self._buffer.append(_bulk_action(self.index_name, doc))
+        self._buffer_bytes += doc_bytes
+
+    def extend(self, documents: Iterable[Dict]):
+        """批量加入文档"""
+        for doc in documents:
+            self.add(doc)
+
+    def flush(self):
+        """提交当前缓冲中的文档，并根据耗时调整批大小"""
+        if not self._buffer:
+            return
+
+        actions = self._buffer
+        self._buffer = []
+        self._buffer_bytes = 0
+
+        start = time.perf_counter()
+        success_count, failed_items = bulk(
+            self.client.options(request_timeout=BULK_REQUEST_TIMEOUT),
+            actions,
+            chunk_size=len(actions),
+            max_chunk_bytes=self.max_chunk_bytes,
+            raise_on_error=False
+        )
+        elapsed = time.perf_counter() - start
+
+        self.success_count += success_count
+        self.failed_items.extend(failed_items)
+
+        rejected = any(
+            result.get("status") == 429
+            for item in failed_items
+            for result in item.values()
+        )
+        if rejected or elapsed > self.slow_seconds:
+            self.chunk_size = max(self.min_chunk_size, self.chunk_size // 2)
+        elif elapsed < self.target_seconds:
+            self.chunk_size = min(self.max_chunk_size, int(self.chunk_size * 1.1) + 1)
+
+        logger.debug(
+            f"ES bulk 提交 {len(actions)} 条, 耗时 {elapsed:.2f}s, 下一批大小: {self.chunk_size}"
+        )
+
+    def close(self) -> int:
+        """提交剩余文档，返回成功写入的总数"""
+        self.flush()
+        if self.failed_items:
+            logger.warning(f"有 {len(self.failed_items)} 条文档插入失败")
+        return self.success_count
+
+    def __enter__(self) -> "ESBulkQueue":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AsyncESClient:
+    """
+    Elasticsearch 异步客户端封装（需要安装 aiohttp）
+
+    在 asyncio 中共用一个 AsyncElasticsearch 实例，多个协程的检索与写入可相互重叠；
+    查询体与结果解析与 ESClient 保持一致
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 9200,
+        index_name: str = "doc_chunks",
+        username: str = "",
+        password: str = "",
+        verify_certs: bool = False,
+        bulk_chunk_size: int = 1000,
+        bulk_max_chunk_bytes: int = 10 * 1024 * 1024
+    ):
+        """
+        初始化异步 ES 客户端（不在构造时发起请求）
+
+        Args:
+            host: ES 主机地址
+            port: ES 端口
+            index_name: 索引名称
+            username: 用户名
+            password: 密码
+            verify_certs: 是否验证证书
+            bulk_chunk_size: 批量写入时每个请求的文档数
+            bulk_max_chunk_bytes: 批量写入时每个请求的最大字节数
+        """
+        self.host = host
+        self.port = port
+        self.index_name = index_name
+        self.bulk_chunk_size = bulk_chunk_size
+        self.bulk_max_chunk_bytes = bulk_max_chunk_bytes
+
+        if username and password:
+            self.client = AsyncElasticsearch(
+                f"http://{host}:{port}",
+                basic_auth=(username, password),
+                verify_certs=verify_certs
+            )
+        else:
+            self.client = AsyncElasticsearch(
+                f"http://{host}:{port}",
+                verify_certs=verify_certs
+            )
+
+    async def insert_documents(self, documents: List[Dict]) -> int:
+        """
+        批量插入文档
+
+        Args:
+            documents: 文档列表
+
+        Returns:
+            int: 插入的文档数量
+        """
+        # stats_only: 只返回 (成功数, 失败数)，不构建失败条目列表
+        success_count, failed_count = await async_bulk(
+            self.client.options(request_timeout=BULK_REQUEST_TIMEOUT),
+            _iter_actions(self.index_name, documents),
+            chunk_size=self.bulk_chunk_size,
+            max_chunk_bytes=self.bulk_max_chunk_bytes,
+            raise_on_error=False,
+            stats_only=True
+        )
+
+        logger.info(f"已插入 {success_count} 条文档到 ES")
+
+        if failed_count:
+            logger.warning(f"有 {failed_count} 条文档插入失败")
+
+        return success_count
+
+    async def search(self, query: str, top_k: int = 10) -> List[Dict]:
+        """
+        执行 BM25 检索
+
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+
+        Returns:
+            List[Dict]: 检索结果
+        """
+        response = await self.client.search(
+            index=self.index_name,
+            body=ESClient._build_query_body(query, top_k)
+        )
+        return ESClient._parse_hits(response)
+
+    async def search_batch(self, queries: List[str], top_k: int = 10) -> List[List[Dict]]:
+        """
+        使用 msearch 批量执行 BM25 检索，单个查询出错时该查询返回空列表
+
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回结果数量
+
+        Returns:
+            List[List[Dict]]: 与查询顺序一致的检索结果列表
+        """
+        if not queries:
+            return []
+
+        response = await self.client.msearch(
+            searches=ESClient._build_msearch_body(self.index_name, queries, top_k)
+        )
+
+        results = []
+        for query, item in zip(queries, response["responses"]):
+            if "error" in item:
+                logger.warning(f"ES msearch 查询失败: {query[:50]}, 错误: {item['error']}")
+                results.append([])
+            else:
+                results.append(ESClient._parse_hits(item))
+
+        return results
+
+    async def close(self):
+        """关闭客户端"""
+        await self.client.close()
+        logger.info("已关闭 ES 异步连接")
+
+    async def __aenter__(self) -> "AsyncESClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
 if __name__ == "__main__":
     # 测试代码
     import os
@@ -2,9 +2,15 @@
 Milvus 客户端封装
 """
 
-from typing import List, Optional
+import atexit
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
 from pathlib import Path
 
+import numpy as np
 from loguru import logger
 from pymilvus import (
     Collection,
@@ -16,6 +22,37 @@ from pymilvus import FieldSchema, DataType
 
 from .schemas import get_milvus_schema, DENSE_INDEX_CONFIG, SPARSE_INDEX_CONFIG
 
+# num_entities 缓存有效期（秒），该值本身只是近似统计
+STATS_CACHE_TTL = 5.0
+
+# 进程内已建立的 Milvus 连接: alias -> uri，同一 uri 的客户端复用已有连接
+_CONNECTED_URIS: Dict[str, str] = {}
+_CONNECT_LOCK = threading.Lock()
+
+
+def _ensure_connection(uri: str, alias: str = "default"):
+    """确保 alias 已连接到 uri，已连接时直接复用；alias 指向其他 uri 时重新连接"""
+    with _CONNECT_LOCK:
+        if _CONNECTED_URIS.get(alias) == uri and connections.has_connection(alias):
+            return
+
+        if connections.has_connection(alias):
+            connections.disconnect(alias)
+        connections.connect(alias, uri=uri)
+        _CONNECTED_URIS[alias] = uri
+        logger.info(f"已连接到 Milvus: {uri}")
+
+
+def shutdown():
+    """断开所有 Milvus 连接（进程退出时自动调用）"""
+    with _CONNECT_LOCK:
+        for alias in list(_CONNECTED_URIS):
+            connections.disconnect(alias)
+        _CONNECTED_URIS.clear()
+
+
+atexit.register(shutdown)
+
 
 class MilvusClient:
     """Milvus 客户端封装"""
@@ -24,7 +61,9 @@ class MilvusClient:
         self,
         uri: str = "milvus_lite.db",
         collection_name: str = "doc_chunks",
-        dense_dim: int = 1024
+        dense_dim: int = 1024,
+        alias: str = "default",
+        insert_batch_size: int = 5000
     ):
         """
         初始化 Milvus 客户端
@@ -33,8 +72,15 @@ class MilvusClient:
             uri: Milvus 连接 URI
             collection_name: Collection 名称
             dense_dim: Dense 向量维度
+            alias: 连接别名，不同别名使用独立的 gRPC 通道
+            insert_batch_size: 插入数据时每批的行数
         """
         self.uri = uri
+        self.alias = alias
+        self.insert_batch_size = insert_batch_size
+        self._pending_inserts = 0
+        self._loaded = False
+        self._num_entities_cache: Optional[Tuple[float, int]] = None
         self.collection_name = collection_name
         self.dense_dim = dense_dim
         self.collection: Optional[Collection] = None
@@ -42,9 +88,8 @@ class MilvusClient:
         self._connect()
 
     def _connect(self):
-        """连接到 Milvus"""
-        connections.connect("default", uri=self.uri)
-        logger.info(f"已连接到 Milvus: {self.uri}")
+        """连接到 Milvus（同一 uri 在进程内只建立一次连接）"""
+        _ensure_connection(self.uri, self.alias)
 
     def create_collection(self, drop_existing: bool = False) -> Collection:
         """
@@ -57,22 +102,27 @@ class MilvusClient:
             Collection: 创建的 Collection 对象
         """
         # 如果已存在且需要删除
-        if utility.has_collection(self.collection_name):
+        if utility.has_collection(self.collection_name, using=self.alias):
             if drop_existing:
-                utility.drop_collection(self.collection_name)
+                utility.drop_collection(self.collection_name, using=self.alias)
                 logger.info(f"已删除现有 Collection: {self.collection_name}")
             else:
                 logger.info(f"Collection 已存在: {self.collection_name}")
-                self.collection = Collection(self.collection_name)
+                self.collection = Collection(self.collection_name, using=self.alias)
                 return self.collection
 
+        # 新建的 Collection 需要重新加载
+        self._loaded = False
+        self._num_entities_cache = None
+
         # 创建 Schema
         schema = get_milvus_schema(dense_dim=self.dense_dim)
 
         # 创建 Collection
         self.collection = Collection(
             name=self.collection_name,
-            schema=schema
+            schema=schema,
+            using=self.alias
         )
         logger.info(f"已创建 Collection: {self.collection_name}")
 
@@ -98,11 +148,15 @@ class MilvusClient:
         logger.info(f"已创建 Sparse 向量索引: {SPARSE_INDEX_CONFIG['index_type']}")
 
     def load_collection(self):
-        """加载 Collection 到内存"""
+        """加载 Collection 到内存（已加载时直接返回，不再发起 load 请求）"""
+        if self._loaded:
+            return
+
         if self.collection is None:
-            self.collection = Collection(self.collection_name)
+            self.collection = Collection(self.collection_name, using=self.alias)
 
         self.collection.load()
+        self._loaded = True
         logger.info(f"已加载 Collection 到内存: {self.collection_name}")
 
     def insert_data(
@@ -113,12 +167,16 @@ class MilvusClient:
         titles: List[str],
         contents: List[str],
         metadata_list: List[dict],
-        dense_vectors: List[List[float]],
-        sparse_vectors: List[dict]
+        dense_vectors: Union[np.ndarray, Sequence[Union[List[float], np.ndarray]]],
+        sparse_vectors: List[dict],
+        flush: bool = False
     ):
         """
         插入数据到 Collection
 
+        按 insert_batch_size 分批插入。默认不 flush，由调用方在导入结束等检查点调用 flush()，
+        多次插入只需 flush 一次
+
         Args:
             ids: 主键列表
             doc_ids: 文档 ID 列表
@@ -126,32 +184,61 @@ class MilvusClient:
             titles: 标题列表
             contents: 内容列表
             metadata_list: 元数据列表
-            dense_vectors: Dense 向量列表
+            dense_vectors: Dense 向量，[N, dim] 数组或向量列表，统一转换为连续的 float32 数组
             sparse_vectors: Sparse 向量列表
+            flush: 插入后是否立即 flush
+
+        Returns:
+            List: 各批次的插入结果
         """
-        data = [
+        # float32 连续数组: 每个分量 4 字节，且无需逐元素装箱为 Python float
+        dense_arr = np.ascontiguousarray(dense_vectors, dtype=np.float32)
+
+        columns = [
             ids,
             doc_ids,
             chunk_ids,
             titles,
             contents,
             metadata_list,
-            dense_vectors,
+            dense_arr,
             sparse_vectors
         ]
 
-        insert_result = self.collection.insert(data)
-        self.collection.flush()
+        total = len(ids)
+        batch_size = self.insert_batch_size
+        insert_results = []
+        for start in range(0, total, batch_size):
+            end = start + batch_size
+            batch = [column[start:end] for column in columns]
+            # Dense 列以 float32 行视图传入（不复制数据）
+            batch[6] = list(batch[6])
+            insert_results.append(self.collection.insert(batch))
 
-        logger.info(f"已插入 {len(ids)} 条数据到 Milvus")
+        self._pending_inserts += total
+        logger.info(f"已插入 {total} 条数据到 Milvus")
 
-        return insert_result
+        if flush:
+            self.flush()
+
+        return insert_results
+
+    def flush(self):
+        """将已插入但未落盘的数据 flush 为持久化段"""
+        if self.collection is None or self._pending_inserts == 0:
+            return
+
+        self.collection.flush()
+        logger.info(f"已 flush {self._pending_inserts} 条数据到 Milvus")
+        self._pending_inserts = 0
+        # 实体数已变化，统计缓存失效；已加载的 Collection 会自动感知新落盘的段，无需重新 load
+        self._num_entities_cache = None
 
     def get_collection(self) -> Collection:
         """获取 Collection 对象"""
         if self.collection is None:
-            if utility.has_collection(self.collection_name):
-                self.collection = Collection(self.collection_name)
+            if utility.has_collection(self.collection_name, using=self.alias):
+                self.collection = Collection(self.collection_name, using=self.alias)
             else:
                 raise ValueError(f"Collection 不存在: {self.collection_name}，请先调用 create_collection()")
         return self.collection
@@ -159,16 +246,88 @@ class MilvusClient:
     def get_stats(self) -> dict:
         """获取 Collection 统计信息"""
         self.load_collection()
-        num_entities = self.collection.num_entities
+
+        # num_entities 需要一次 RPC，短时间内重复调用直接使用缓存
+        now = time.monotonic()
+        if self._num_entities_cache is not None and now - self._num_entities_cache[0] < STATS_CACHE_TTL:
+            num_entities = self._num_entities_cache[1]
+        else:
+            num_entities = self.collection.num_entities
+            self._num_entities_cache = (now, num_entities)
+
         return {
             "collection_name": self.collection_name,
             "num_entities": num_entities
         }
 
     def disconnect(self):
-        """断开连接"""
-        connections.disconnect("default")
-        logger.info("已断开 Milvus 连接")
+        """
+        释放当前客户端持有的 Collection（释放前 flush 未落盘的数据）
+
+        底层连接在进程内共享，由 shutdown() 在进程退出时统一断开
+        """
+        self.flush()
+        self.collection = None
+        self._loaded = False
+        logger.info("已释放 Milvus 客户端（连接保持复用）")
+
+
+class MilvusClientPool:
+    """
+    Milvus 连接池
+
+    维护 size 个独立连接别名（pool_0 .. pool_{size-1}），每个别名对应独立的 gRPC 通道，
+    并发检索时各线程取用不同连接，避免共用单个通道排队。
+    嵌入式 Milvus Lite 场景收益有限，主要用于 Milvus 服务端
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        collection_name: str = "doc_chunks",
+        size: int = 8,
+        load: bool = True
+    ):
+        """
+        初始化连接池
+
+        Args:
+            uri: Milvus 连接 URI
+            collection_name: Collection 名称
+            size: 连接数量（建议 8-16）
+            load: 是否加载 Collection 到内存
+        """
+        self.uri = uri
+        self.collection_name = collection_name
+        self.size = size
+        self._pool: "queue.Queue[Tuple[str, Collection]]" = queue.Queue(maxsize=size)
+
+        for i in range(size):
+            alias = f"pool_{i}"
+            _ensure_connection(uri, alias)
+            collection = Collection(collection_name, using=alias)
+            if load and i == 0:
+                collection.load()
+            self._pool.put((alias, collection))
+
+        logger.info(f"已创建 Milvus 连接池: {uri}, 连接数: {size}")
+
+    def get(self, timeout: Optional[float] = None) -> Tuple[str, Collection]:
+        """取出一个连接，返回 (alias, Collection)；连接全部占用时阻塞等待"""
+        return self._pool.get(timeout=timeout)
+
+    def put(self, item: Tuple[str, Collection]):
+        """归还连接"""
+        self._pool.put(item)
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None) -> Iterator[Tuple[str, Collection]]:
+        """以上下文管理器方式取用连接，退出时自动归还"""
+        item = self.get(timeout=timeout)
+        try:
+            yield item
+        finally:
+            self.put(item)
 
 
 if __name__ == "__main__":
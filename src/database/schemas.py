@@ -2,6 +2,8 @@
 Milvus 和 Elasticsearch Schema 定义
 """
 
+from functools import lru_cache
+
 from pymilvus import (
     CollectionSchema,
     DataType,
@@ -83,10 +85,13 @@ ES_INDEX_MAPPING = {
 }
 
 
+@lru_cache(maxsize=4)
 def get_milvus_schema(dense_dim: int = 1024) -> CollectionSchema:
     """
     获取 Milvus Collection Schema
 
+    同一维度返回同一个缓存实例，调用方不应修改
+
     Args:
         dense_dim: Dense 向量维度
 
@@ -109,12 +114,17 @@ def get_milvus_schema(dense_dim: int = 1024) -> CollectionSchema:
     )
 
 
-def get_es_mapping(use_ik_analyzer: bool = False) -> dict:
+@lru_cache(maxsize=4)
+def get_es_mapping(use_ik_analyzer: bool = False, bulk_ingest: bool = False) -> dict:
     """
     获取 Elasticsearch Index Mapping
 
+    同一参数返回同一个缓存字典，调用方不应修改
+
     Args:
         use_ik_analyzer: 是否使用 IK 中文分词器
+        bulk_ingest: 是否使用批量导入设置（translog 异步落盘、更大的 flush 阈值、30s 刷新间隔），
+            导入完成后应通过 put_settings 将 index.translog.durability 恢复为 request
 
     Returns:
         dict: ES Mapping
@@ -122,7 +132,7 @@ def get_es_mapping(use_ik_analyzer: bool = False) -> dict:
     analyzer = "ik_max_word" if use_ik_analyzer else "standard"
     search_analyzer = "ik_smart" if use_ik_analyzer else "standard"
 
-    return {
+    mapping = {
         "mappings": {
             "properties": {
                 "doc_id": {"type": "keyword"},
@@ -156,6 +166,15 @@ def get_es_mapping(use_ik_analyzer: bool = False) -> dict:
         }
     }
 
+    if bulk_ingest:
+        mapping["settings"].update({
+            "index.translog.durability": "async",
+            "index.translog.flush_threshold_size": "1gb",
+            "index.refresh_interval": "30s",
+        })
+
+    return mapping
+
 
 if __name__ == "__main__":
     # 测试代码
@@ -2,11 +2,20 @@
 SeekDB 客户端封装，支持 GLM Embedding
 """
 
+import numpy as np
 import pyseekdb
 from loguru import logger
+import sys
+from functools import lru_cache
 from typing import List, Optional, Union
 
-from src.models.dense_embedding import GLMEmbedding
+from src.models.dense_embedding import get_glm_embedding
+
+# metadata 中的固定键，所有行共用同一字符串对象
+# （SeekDB 只有 ids / documents / metadatas 三列，检索结果依赖 metadata 中的这些字段，不能省略）
+_DOC_ID = sys.intern("doc_id")
+_CHUNK_ID = sys.intern("chunk_id")
+_TITLE = sys.intern("title")
 
 
 class GLMEmbeddingFunction:
@@ -15,28 +24,46 @@ class GLMEmbeddingFunction:
     将 GLM Embedding API 适配为 SeekDB 的 EmbeddingFunction 接口
     """
 
-    def __init__(self, api_key: str, model: str = "embedding-3"):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "embedding-3",
+        batch_size: int = 64,
+        cache_size: int = 10_000
+    ):
         """
         初始化 GLM Embedding Function
 
         Args:
             api_key: GLM API Key
             model: GLM 模型名称
+            batch_size: 每次 API 请求的文本数
+            cache_size: 单文本向量缓存容量（检索时同一查询文本只请求一次）
         """
         self.api_key = api_key
         self.model = model
+        self.batch_size = batch_size
         self._model = None
+        self._encode_cached = lru_cache(maxsize=cache_size)(self._encode_one)
 
-    @property
-    def dimension(self) -> int:
-        """获取向量维度"""
+    def _get_model(self):
+        """获取 GLM Embedding 模型（首次调用时创建）"""
         if self._model is None:
-            self._model = GLMEmbedding(
+            self._model = get_glm_embedding(
                 api_key=self.api_key,
                 model=self.model,
                 auto_detect_dim=True
             )
-        return self._model.dimension
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        """获取向量维度"""
+        return self._get_model().dimension
+
+    def _encode_one(self, text: str) -> List[float]:
+        """生成单个文本的向量（经 _encode_cached 缓存）"""
+        return self._get_model().encode([text], batch_size=1)[0].tolist()
 
     def __call__(self, input: Union[str, List[str]]) -> List[List[float]]:
         """
@@ -48,13 +75,6 @@ class GLMEmbeddingFunction:
         Returns:
             向量列表
         """
-        if self._model is None:
-            self._model = GLMEmbedding(
-                api_key=self.api_key,
-                model=self.model,
-                auto_detect_dim=True
-            )
-
         # 处理单个字符串输入
         if isinstance(input, str):
             input = [input]
@@ -63,11 +83,16 @@ class GLMEmbeddingFunction:
         if not input:
             return []
 
+        # 单个文本（检索查询）走缓存
+        if len(input) == 1:
+            return [self._encode_cached(input[0])]
+
         # 批量生成向量
-        embeddings = self._model.encode(input, batch_size=10)
+        embeddings = self._get_model().encode(input, batch_size=self.batch_size)
 
-        # 转换为列表格式
-        return embeddings.tolist()
+        # pyseekdb 的 EmbeddingFunction 约定返回 list[list[float]]（向量以文本形式写入 SQL），
+        # 无法直接传 ndarray；在连续 float32 缓冲上一次性 tolist，不做额外 dtype 转换
+        return embeddings.astype(np.float32, copy=False).tolist()
 
 
 class SeekDBClient:
@@ -219,16 +244,11 @@ class SeekDBClient:
         """
         插入数据到 Collection（向量自动生成）
         """
-        # 构建增强的 metadata
-        enhanced_metadata = []
-        for i, meta in enumerate(metadata_list):
-            enhanced = {
-                **meta,
-                "doc_id": doc_ids[i],
-                "chunk_id": chunk_ids[i],
-                "title": titles[i]
-            }
-            enhanced_metadata.append(enhanced)
+        # 构建增强的 metadata（复制而非原地修改，调用方的 metadata 保持不变）
+        enhanced_metadata = [
+            {**meta, _DOC_ID: doc_id, _CHUNK_ID: chunk_id, _TITLE: title}
+            for meta, doc_id, chunk_id, title in zip(metadata_list, doc_ids, chunk_ids, titles)
+        ]
 
         self.collection.add(
             ids=ids,
@@ -2,10 +2,43 @@
 检索评估指标模块
 """
 
-from typing import Dict, List, Set
+import math
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate, repeat
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 import numpy as np
 
+# 排名折损表: _DISCOUNTS[i] = 1 / log2(i + 2)，即第 i + 1 名的折损（Python float 列表，避免 NumPy 标量装箱）
+_MAX_RANK = 4096
+_DISCOUNTS = (1.0 / np.log2(np.arange(2, _MAX_RANK + 2, dtype=np.float64))).tolist()
+# IDCG 前缀和: _IDCG_PREFIX[r] 为 r 个相关文档的理想 DCG
+_IDCG_PREFIX = [0.0] + list(accumulate(_DISCOUNTS))
+
+
+def _discount(i: int) -> float:
+    """第 i + 1 名的折损，超出预计算范围时直接计算"""
+    return _DISCOUNTS[i] if i < _MAX_RANK else 1.0 / math.log2(i + 2)
+
+
+def build_doc_index(relevant_sets: Iterable[Set[str]]) -> Dict[str, int]:
+    """
+    为所有相关文档分配整数 ID
+
+    只有相关文档可能命中，未出现在映射中的检索结果统一编码为 -1
+
+    Args:
+        relevant_sets: 各查询的相关文档集合
+
+    Returns:
+        Dict[str, int]: 文档 ID -> 整数 ID
+    """
+    doc2id: Dict[str, int] = {}
+    for relevant_docs in relevant_sets:
+        for doc_id in relevant_docs:
+            doc2id.setdefault(doc_id, len(doc2id))
+    return doc2id
+
 
 class RetrievalMetrics:
     """检索评估指标计算类"""
@@ -27,8 +60,8 @@ class RetrievalMetrics:
         """
         if not relevant_docs:
             return 0.0
-        retrieved_at_k = set(retrieved_docs[:k])
-        return len(retrieved_at_k & relevant_docs) / len(relevant_docs)
+        # 只对前 K 个结果逐个探测相关集合，不再为检索结果构建中间集合（重复文档仍只计一次）
+        return len(relevant_docs.intersection(retrieved_docs[:k])) / len(relevant_docs)
 
     @staticmethod
     def precision_at_k(retrieved_docs: List[str], relevant_docs: Set[str], k: int) -> float:
@@ -47,8 +80,8 @@ class RetrievalMetrics:
         """
         if k == 0:
             return 0.0
-        retrieved_at_k = set(retrieved_docs[:k])
-        return len(retrieved_at_k & relevant_docs) / k
+        # 只对前 K 个结果逐个探测相关集合，不再为检索结果构建中间集合（重复文档仍只计一次）
+        return len(relevant_docs.intersection(retrieved_docs[:k])) / k
 
     @staticmethod
     def mrr(retrieved_docs: List[str], relevant_docs: Set[str]) -> float:
@@ -84,14 +117,18 @@ class RetrievalMetrics:
         Returns:
             float: NDCG@K 值
         """
-        # 计算 DCG
+        # 计算 DCG（折损查表）
         dcg = 0.0
-        for i, doc_id in enumerate(retrieved_docs[:k], 1):
+        for i, doc_id in enumerate(retrieved_docs[:k]):
             if doc_id in relevant_docs:
-                dcg += 1.0 / np.log2(i + 1)
+                dcg += _discount(i)
 
-        # 计算 IDCG (理想情况)
-        idcg = sum(1.0 / np.log2(i + 1) for i in range(1, min(len(relevant_docs), k) + 1))
+        # 计算 IDCG (理想情况)，前缀和查表
+        n_ideal = min(len(relevant_docs), k)
+        if n_ideal <= _MAX_RANK:
+            idcg = _IDCG_PREFIX[n_ideal]
+        else:
+            idcg = _IDCG_PREFIX[_MAX_RANK] + sum(_discount(i) for i in range(_MAX_RANK, n_ideal))
 
         return dcg / idcg if idcg > 0 else 0.0
 
@@ -160,6 +197,15 @@ class Evaluator:
         self.k_values = k_values or [1, 3, 5, 10]
         self.metrics = RetrievalMetrics()
 
+        # 排名折损与 IDCG 查找表: _idcg_table[r - 1] 为 r 个相关文档的理想 DCG
+        # 复用模块级 _DISCOUNTS / _IDCG_PREFIX，与单查询 ndcg_at_k 取值一致
+        max_k = max(max(self.k_values), 10)
+        self._discount = np.array([_discount(i) for i in range(max_k)], dtype=np.float64)
+        if max_k <= _MAX_RANK:
+            self._idcg_table = np.array(_IDCG_PREFIX[1 : max_k + 1], dtype=np.float64)
+        else:
+            self._idcg_table = np.array(list(accumulate(self._discount.tolist())), dtype=np.float64)
+
     def evaluate_single_query(
         self,
         retrieved_docs: List[str],
@@ -175,16 +221,53 @@ class Evaluator:
         Returns:
             Dict[str, float]: 各指标值
         """
+        # 命中掩码只探测一次，MRR / NDCG / MAP / Recall / Precision 均由其导出
+        depth = max(max(self.k_values), 10)
+        hits = [doc_id in relevant_docs for doc_id in retrieved_docs[:depth]]
+
+        # MRR: 首个相关文档排名的倒数，掩码范围内无命中时继续向后查找
+        if True in hits:
+            mrr = 1.0 / (hits.index(True) + 1)
+        else:
+            first_rank = next(
+                (i for i, doc_id in enumerate(retrieved_docs[depth:], depth + 1) if doc_id in relevant_docs),
+                None
+            )
+            mrr = 1.0 / first_rank if first_rank else 0.0
+
+        # NDCG@10 / MAP@10（与 ndcg_at_k / map_at_k 逐项累加顺序一致）
+        dcg = 0.0
+        precisions = []
+        for i, hit in enumerate(hits[:10]):
+            if hit:
+                dcg += _DISCOUNTS[i]
+                precisions.append((len(precisions) + 1) / (i + 1))
+        idcg = _IDCG_PREFIX[min(len(relevant_docs), 10)]
+
         results = {
-            "mrr": self.metrics.mrr(retrieved_docs, relevant_docs),
-            "ndcg@10": self.metrics.ndcg_at_k(retrieved_docs, relevant_docs, 10),
-            "map@10": self.metrics.map_at_k(retrieved_docs, relevant_docs, 10),
+            "mrr": mrr,
+            "ndcg@10": dcg / idcg if idcg > 0 else 0.0,
+            "map@10": np.mean(precisions) if precisions else 0.0,
         }
 
+        # Recall / Precision 按集合语义计数，重复文档只计首次出现
+        seen = set()
+        first_hits = []
+        for doc_id, hit in zip(retrieved_docs[:max(self.k_values)], hits):
+            first_hits.append(hit and doc_id not in seen)
+            seen.add(doc_id)
+        hit_counts = list(accumulate(first_hits, initial=0))
+        n_relevant = len(relevant_docs)
+
         for k in self.k_values:
-            results[f"recall@{k}"] = self.metrics.recall_at_k(retrieved_docs, relevant_docs, k)
-            results[f"precision@{k}"] = self.metrics.precision_at_k(retrieved_docs, relevant_docs, k)
-            results[f"f1@{k}"] = self.metrics.f1_at_k(retrieved_docs, relevant_docs, k)
+            n_hits = hit_counts[min(k, len(hit_counts) - 1)]
+            precision = n_hits / k if k else 0.0
+            recall = n_hits / n_relevant if n_relevant else 0.0
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+            results[f"recall@{k}"] = recall
+            results[f"precision@{k}"] = precision
+            results[f"f1@{k}"] = f1
 
         return results
 
@@ -196,6 +279,8 @@ class Evaluator:
         """
         评估所有查询的平均结果
 
+        基于命中矩阵一次性计算，结果与逐查询调用 evaluate_single_query 后取平均一致
+
         Args:
             all_results: 查询 ID -> 检索结果列表
             all_relevant: 查询 ID -> 相关文档集合
@@ -203,39 +288,15 @@ class Evaluator:
         Returns:
             Dict[str, float]: 各指标的平均值
         """
-        metric_sums = {}
-        metric_counts = {}
-        query_count = 0
-
-        for query_id, retrieved_docs in all_results.items():
-            relevant_docs = all_relevant.get(query_id, set())
-            if not relevant_docs:
-                continue
-
-            metrics = self.evaluate_single_query(retrieved_docs, relevant_docs)
-
-            for metric_name, value in metrics.items():
-                if metric_name not in metric_sums:
-                    metric_sums[metric_name] = 0.0
-                    metric_counts[metric_name] = 0
-                metric_sums[metric_name] += value
-                metric_counts[metric_name] += 1
-
-            query_count += 1
-
-        # 计算平均值
-        avg_metrics = {}
-        for metric_name in metric_sums:
-            avg_metrics[metric_name] = metric_sums[metric_name] / metric_counts[metric_name]
-
-        avg_metrics["query_count"] = query_count
-
-        return avg_metrics
+        doc2id = build_doc_index(all_relevant.get(query_id, ()) for query_id in all_results)
+        return self._evaluate_method(all_results, all_relevant, doc2id)
 
     def compare_results(
         self,
         methods_results: Dict[str, Dict[str, List[str]]],
-        all_relevant: Dict[str, Set[str]]
+        all_relevant: Dict[str, Set[str]],
+        doc2id: Optional[Dict[str, int]] = None,
+        max_workers: Optional[int] = None
     ) -> Dict[str, Dict[str, float]]:
         """
         比较多个检索方法的结果
@@ -243,17 +304,164 @@ class Evaluator:
         Args:
             methods_results: 方法名 -> {查询ID -> 检索结果}
             all_relevant: 查询 ID -> 相关文档集合
+            doc2id: 相关文档的整数 ID 映射（见 build_doc_index），未提供时自动构建，各方法共用
+            max_workers: 大于 1 时使用多进程并行评估各方法，默认串行
 
         Returns:
             Dict[str, Dict[str, float]]: 方法名 -> 指标值
         """
-        comparison = {}
+        if doc2id is None:
+            doc2id = build_doc_index(all_relevant.values())
+
+        method_names = list(methods_results)
+
+        if max_workers and max_workers > 1 and len(method_names) > 1:
+            # 各方法评估相互独立，按方法分发到子进程
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(method_names))) as executor:
+                metrics_list = list(executor.map(
+                    self._evaluate_method,
+                    [methods_results[name] for name in method_names],
+                    repeat(all_relevant),
+                    repeat(doc2id)
+                ))
+        else:
+            metrics_list = [
+                self._evaluate_method(methods_results[name], all_relevant, doc2id)
+                for name in method_names
+            ]
+
+        return dict(zip(method_names, metrics_list))
+
+    def _evaluate_method(
+        self,
+        all_results: Dict[str, List[str]],
+        all_relevant: Dict[str, Set[str]],
+        doc2id: Dict[str, int]
+    ) -> Dict[str, float]:
+        """评估单个方法的所有查询（可在子进程中执行）"""
+        hits, first_hits, rel_counts = self._build_hit_matrices(all_results, all_relevant, doc2id)
+        return self._batch_metrics(hits, first_hits, rel_counts)
+
+    def _build_hit_matrices(
+        self,
+        all_results: Dict[str, List[str]],
+        all_relevant: Dict[str, Set[str]],
+        doc2id: Dict[str, int]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        构建命中矩阵
+
+        文档 ID 先编码为整数，命中判断通过 np.isin 在 (查询序号, 文档整数 ID) 组合键上完成。
+        只包含有相关文档的查询，宽度取 max(K, 最长检索结果)，不足部分补 -1
 
-        for method_name, all_results in methods_results.items():
-            avg_metrics = self.evaluate_all_queries(all_results, all_relevant)
-            comparison[method_name] = avg_metrics
+        Args:
+            all_results: 查询 ID -> 检索结果列表
+            all_relevant: 查询 ID -> 相关文档集合
+            doc2id: 相关文档的整数 ID 映射
 
-        return comparison
+        Returns:
+            Tuple: (hits, first_hits, rel_counts)
+                hits[q, i]: 第 i 个结果是否相关（重复文档每次都计）
+                first_hits[q, i]: 第 i 个结果是否为首次出现的相关文档（用于 recall / precision 的集合语义）
+                rel_counts[q]: 相关文档数量
+        """
+        evaluated = []
+        for query_id, retrieved_docs in all_results.items():
+            relevant_docs = all_relevant.get(query_id, set())
+            if relevant_docs:
+                evaluated.append((retrieved_docs, relevant_docs))
+
+        n_queries = len(evaluated)
+        n_docs = len(doc2id)
+        width = max([max(self.k_values), 10] + [len(docs) for docs, _ in evaluated])
+
+        retrieved = np.full((n_queries, width), -1, dtype=np.int64)
+        rel_counts = np.zeros(n_queries, dtype=np.float64)
+        relevant_keys = []
+        get_id = doc2id.get
+
+        for q, (retrieved_docs, relevant_docs) in enumerate(evaluated):
+            retrieved[q, :len(retrieved_docs)] = [get_id(doc_id, -1) for doc_id in retrieved_docs]
+            rel_counts[q] = len(relevant_docs)
+            relevant_keys.append(
+                q * n_docs + np.fromiter((doc2id[doc_id] for doc_id in relevant_docs), dtype=np.int64)
+            )
+
+        # 组合键: 查询序号 * 文档数 + 文档整数 ID；未知文档保持 -1，不会命中
+        query_offsets = np.arange(n_queries, dtype=np.int64)[:, None] * n_docs
+        keys = np.where(retrieved >= 0, query_offsets + retrieved, -1)
+        all_relevant_keys = np.concatenate(relevant_keys) if relevant_keys else np.empty(0, dtype=np.int64)
+        hits = np.isin(keys, all_relevant_keys)
+
+        # 同一查询中此前已出现过的文档（W 很小，直接两两比较）
+        earlier = np.tril(np.ones((width, width), dtype=np.bool_), k=-1)
+        seen_before = ((retrieved[:, :, None] == retrieved[:, None, :]) & earlier).any(axis=2)
+        first_hits = hits & ~seen_before
+
+        return hits, first_hits, rel_counts
+
+    def _batch_metrics(
+        self,
+        hits: np.ndarray,
+        first_hits: np.ndarray,
+        rel_counts: np.ndarray
+    ) -> Dict[str, float]:
+        """
+        基于命中矩阵一次性计算所有查询的平均指标
+
+        结果与逐查询调用 evaluate_single_query 后取平均一致
+
+        Args:
+            hits: 命中矩阵 [Q, W]
+            first_hits: 首次命中矩阵 [Q, W]
+            rel_counts: 每个查询的相关文档数量 [Q]
+
+        Returns:
+            Dict[str, float]: 各指标的平均值
+        """
+        query_count = hits.shape[0]
+        if query_count == 0:
+            return {"query_count": 0}
+
+        ranks = np.arange(1, hits.shape[1] + 1, dtype=np.float64)
+
+        # MRR: 首个相关结果排名的倒数（argmax 返回首个 True 的位置，无命中的查询记 0）
+        first_hit = np.argmax(hits, axis=1)
+        mrr = np.where(hits.any(axis=1), 1.0 / (first_hit + 1), 0.0)
+
+        # NDCG@10: 折损与 IDCG 均取自预计算的查找表
+        dcg = hits[:, :10] @ self._discount[:10]
+        idcg = self._idcg_table[np.minimum(rel_counts, 10).astype(np.int64) - 1]
+        ndcg = dcg / idcg
+
+        # MAP@10: 每个命中位置的精确率取平均
+        hit_count = np.cumsum(hits[:, :10], axis=1)
+        precision_sum = (hits[:, :10] * hit_count / ranks[:10]).sum(axis=1)
+        n_hits = hit_count[:, -1]
+        ap = np.divide(precision_sum, n_hits, out=np.zeros(query_count), where=n_hits > 0)
+
+        avg_metrics = {
+            "mrr": float(mrr.mean()),
+            "ndcg@10": float(ndcg.mean()),
+            "map@10": float(ap.mean()),
+        }
+
+        # Recall / Precision / F1（相关文档按集合去重计数）
+        unique_hit_count = np.cumsum(first_hits, axis=1)
+        for k in self.k_values:
+            n_relevant = unique_hit_count[:, k - 1]
+            precision = n_relevant / k
+            recall = n_relevant / rel_counts
+            pr_sum = precision + recall
+            f1 = np.divide(2 * precision * recall, pr_sum, out=np.zeros(query_count), where=pr_sum > 0)
+
+            avg_metrics[f"recall@{k}"] = float(recall.mean())
+            avg_metrics[f"precision@{k}"] = float(precision.mean())
+            avg_metrics[f"f1@{k}"] = float(f1.mean())
+
+        avg_metrics["query_count"] = query_count
+
+        return avg_metrics
 
 
 if __name__ == "__main__":
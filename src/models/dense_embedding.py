@@ -2,12 +2,133 @@
 GLM Dense Embedding 模型
 """
 
+import hashlib
+import sqlite3
+import threading
 import time
-from typing import List, Union
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
 
+import httpx
 import numpy as np
 from loguru import logger
-from zhipuai import ZhipuAI
+from zhipuai import APIStatusError, ZhipuAI
+
+# 进程内共享的 HTTP 客户端，复用 keep-alive 连接，避免重复 TCP/TLS 握手
+_HTTP_CLIENT: Optional[httpx.Client] = None
+_HTTP_CLIENT_LOCK = threading.Lock()
+
+# 限流（429）与服务端错误（5xx）的重试次数及指数退避基数（秒）
+MAX_RETRIES = 5
+RETRY_BACKOFF = 0.5
+
+
+def get_http_client() -> httpx.Client:
+    """获取进程内共享的 HTTP 客户端（首次调用时创建）"""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        with _HTTP_CLIENT_LOCK:
+            if _HTTP_CLIENT is None:
+                _HTTP_CLIENT = httpx.Client(timeout=30)
+    return _HTTP_CLIENT
+
+
+class RateLimiter:
+    """
+    线程安全的令牌桶限流器
+
+    令牌按 rate 个/秒补充，最多累积 capacity 个；每次请求消耗一个令牌，不足时等待
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        初始化限流器
+
+        Args:
+            rate: 每秒补充的令牌数（即稳定 QPS）
+            capacity: 令牌桶容量（允许的突发请求数），默认等于 rate
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """获取一个令牌，必要时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class EmbeddingCache:
+    """
+    基于 SQLite 的向量缓存
+
+    键为 sha256(模型名 + "|" + 文本)，值为 float32 向量的原始字节；
+    重复运行（如只调整评估指标）时已生成过的文本不再请求 API
+    """
+
+    # SQLite 单条语句的参数个数上限较小，批量查询时分段
+    _QUERY_CHUNK = 500
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        初始化向量缓存
+
+        Args:
+            path: SQLite 数据库文件路径
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS emb (key BLOB PRIMARY KEY, vec BLOB NOT NULL)")
+
+    @staticmethod
+    def make_key(model: str, text: str) -> bytes:
+        """生成缓存键"""
+        return hashlib.sha256(f"{model}|{text}".encode("utf-8")).digest()
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+        """批量查询，返回命中的 键 -> 向量"""
+        found: Dict[bytes, np.ndarray] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(unique_keys), self._QUERY_CHUNK):
+                chunk = unique_keys[i:i + self._QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM emb WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, vec in rows:
+                    found[key] = np.frombuffer(vec, dtype=np.float32)
+        return found
+
+    def put_many(self, items: Sequence[tuple]):
+        """批量写入 (键, 向量)，在一个事务中提交"""
+        if not items:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO emb (key, vec) VALUES (?, ?)",
+                [(key, np.asarray(vec, dtype=np.float32).tobytes()) for key, vec in items]
+            )
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
 
 
 class GLMEmbedding:
@@ -17,18 +138,34 @@ class GLMEmbedding:
     使用智谱 AI Embedding API 生成稠密向量
     """
 
-    def __init__(self, api_key: str, model: str = "embedding-3", auto_detect_dim: bool = True):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "embedding-3",
+        auto_detect_dim: bool = True,
+        http_client: Optional[httpx.Client] = None,
+        cache_path: Optional[str] = None,
+        requests_per_second: float = 10.0,
+        max_workers: int = 8
+    ):
         """
         初始化 GLM Embedding 模型
 
         Args:
             api_key: 智谱 AI API Key
             model: 模型名称，默认为 embedding-3
-            auto_detect_dim: 是否自动检测向量维度
+            auto_detect_dim: 是否自动检测向量维度（检测失败时抛出 RuntimeError；为 False 时使用 1024）
+            http_client: HTTP 客户端，默认使用进程内共享的客户端
+            cache_path: 向量缓存（SQLite）路径，为空时不缓存
+            requests_per_second: API 请求速率上限（所有线程共享）
+            max_workers: 逐条请求降级时的并发线程数
         """
-        self.client = ZhipuAI(api_key=api_key)
+        self.client = ZhipuAI(api_key=api_key, http_client=http_client or get_http_client())
         self.model = model
         self.dimension = 1024  # 默认维度
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.max_workers = max_workers
 
         # 自动检测向量维度
         if auto_detect_dim:
@@ -37,23 +174,27 @@ class GLMEmbedding:
         logger.info(f"GLM Embedding 模型初始化完成: {model}, 维度: {self.dimension}")
 
     def _detect_dimension(self) -> int:
-        """检测向量维度"""
+        """
+        检测向量维度
+
+        经 _create 请求（受限流约束，429 / 5xx 时重试）；重试后仍失败则抛出异常，
+        避免以错误的默认维度建库或写入向量
+        """
         try:
-            response = self.client.embeddings.create(
-                model=self.model,
-                input="test"
-            )
-            dim = len(response.data[0].embedding)
-            logger.info(f"自动检测到向量维度: {dim}")
-            return dim
+            response = self._create("test")
         except Exception as e:
-            logger.warning(f"无法检测向量维度，使用默认值 1024: {e}")
-            return 1024
+            raise RuntimeError(f"无法检测向量维度: {e}") from e
+
+        dim = len(response.data[0].embedding)
+        logger.info(f"自动检测到向量维度: {dim}")
+        return dim
 
     def encode(self, texts: List[str], batch_size: int = 10) -> np.ndarray:
         """
         批量生成稠密向量
 
+        启用缓存时只为未命中的文本请求 API，新生成的向量在一个事务中写回缓存
+
         Args:
             texts: 文本列表
             batch_size: 批处理大小
@@ -61,29 +202,92 @@ class GLMEmbedding:
         Returns:
             np.ndarray: 向量数组，形状为 (len(texts), dimension)
         """
-        embeddings = []
+        if self.cache is None:
+            return self._encode_batches(texts, batch_size)
+
+        keys = [EmbeddingCache.make_key(self.model, text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        if missing:
+            new_embeddings = self._encode_batches([texts[i] for i in missing], batch_size)
+            # 失败降级得到的零向量不写入缓存
+            self.cache.put_many([
+                (keys[i], vec) for i, vec in zip(missing, new_embeddings) if vec.any()
+            ])
+            for i, vec in zip(missing, new_embeddings):
+                cached.setdefault(keys[i], vec)
+
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return np.stack([cached[key] for key in keys]).astype(np.float32, copy=False)
+
+    def _create(self, input: Union[str, List[str]]):
+        """
+        请求 Embedding API
+
+        仅在限流（429）或服务端错误（5xx）时按 0.5s、1s、2s... 指数退避重试，
+        其他错误直接抛出；正常路径没有任何固定等待
+        """
+        for attempt in range(MAX_RETRIES):
+            self.rate_limiter.acquire()
+            try:
+                return self.client.embeddings.create(model=self.model, input=input)
+            except APIStatusError as e:
+                retryable = e.status_code == 429 or e.status_code >= 500
+                if not retryable or attempt == MAX_RETRIES - 1:
+                    raise
+                wait = RETRY_BACKOFF * 2 ** attempt
+                logger.warning(f"Embedding API 返回 {e.status_code}，{wait:.1f}s 后重试 ({attempt + 1}/{MAX_RETRIES})")
+                time.sleep(wait)
 
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i + batch_size]
+    def _encode_batches(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """按批请求 API 生成向量（不经过缓存），结果直接写入预分配的 float32 数组"""
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
 
-            for text in batch_texts:
-                try:
-                    response = self.client.embeddings.create(
-                        model=self.model,
-                        input=text
+        for start in range(0, len(texts), batch_size):
+            batch_texts = texts[start:start + batch_size]
+            end = start + len(batch_texts)
+
+            try:
+                # 一次请求提交整批文本，返回结果按 index 与输入对应
+                response = self._create(batch_texts)
+                data = sorted(response.data, key=lambda d: d.index)
+                batch = np.asarray([d.embedding for d in data], dtype=np.float32)
+                # 行数或维度与预期不符（如维度检测失败后使用了默认值）时同样走降级逻辑
+                if batch.shape != (len(batch_texts), self.dimension):
+                    raise ValueError(
+                        f"返回向量形状 {batch.shape} 与预期 {(len(batch_texts), self.dimension)} 不一致"
                     )
-                    embedding = response.data[0].embedding
-                    embeddings.append(embedding)
+            except Exception as e:
+                logger.warning(f"批量生成向量失败，改为并发逐条请求: {e}")
+                embeddings[start:end] = self._encode_one_by_one(batch_texts)
+                continue
 
-                except Exception as e:
-                    logger.error(f"生成向量失败: {e}, 文本: {text[:50]}...")
-                    # 使用零向量作为降级方案
-                    embeddings.append([0.0] * self.dimension)
+            embeddings[start:end] = batch
 
-                # 避免触发 API 限流
-                time.sleep(0.1)
+        return embeddings
 
-        return np.array(embeddings, dtype=np.float32)
+    def _request_single(self, text: str) -> List[float]:
+        """单条请求 API，失败或维度不符时返回零向量"""
+        try:
+            embedding = self._create(text).data[0].embedding
+            if len(embedding) != self.dimension:
+                raise ValueError(f"返回向量维度 {len(embedding)} 与预期 {self.dimension} 不一致")
+            return embedding
+
+        except Exception as e:
+            logger.error(f"生成向量失败: {e}, 文本: {text[:50]}...")
+            # 使用零向量作为降级方案
+            return [0.0] * self.dimension
+
+    def _encode_one_by_one(self, texts: List[str]) -> List[List[float]]:
+        """并发逐条生成向量（受共享限流器约束），结果与输入顺序一致"""
+        if len(texts) <= 1:
+            return [self._request_single(text) for text in texts]
+
+        with ThreadPoolExecutor(max_workers=min(len(texts), self.max_workers)) as executor:
+            return list(executor.map(self._request_single, texts))
 
     def encode_single(self, text: str) -> np.ndarray:
         """
@@ -95,16 +299,8 @@ class GLMEmbedding:
         Returns:
             np.ndarray: 向量数组
         """
-        try:
-            response = self.client.embeddings.create(
-                model=self.model,
-                input=text
-            )
-            return np.array(response.data[0].embedding, dtype=np.float32)
-
-        except Exception as e:
-            logger.error(f"生成向量失败: {e}, 文本: {text[:50]}...")
-            return np.zeros(self.dimension, dtype=np.float32)
+        # 与批量接口共用缓存、限流与失败降级逻辑
+        return self.encode([text], batch_size=1)[0]
 
     @property
     def dim(self) -> int:
@@ -112,6 +308,35 @@ class GLMEmbedding:
         return self.dimension
 
 
+@lru_cache(maxsize=None)
+def get_glm_embedding(
+    api_key: str,
+    model: str = "embedding-3",
+    auto_detect_dim: bool = True,
+    cache_path: Optional[str] = None
+) -> GLMEmbedding:
+    """
+    获取共享的 GLMEmbedding 实例
+
+    相同参数只创建一次（维度检测请求也只发送一次）
+
+    Args:
+        api_key: 智谱 AI API Key
+        model: 模型名称
+        auto_detect_dim: 是否自动检测向量维度
+        cache_path: 向量缓存（SQLite）路径，为空时不缓存
+
+    Returns:
+        GLMEmbedding: 共享实例
+    """
+    return GLMEmbedding(
+        api_key=api_key,
+        model=model,
+        auto_detect_dim=auto_detect_dim,
+        cache_path=cache_path or None
+    )
+
+
 if __name__ == "__main__":
     # 测试代码
     import os
@@ -2,15 +2,45 @@
 BM25 Sparse Embedding 模型
 """
 
-from collections import defaultdict
-from typing import Dict, List, Set
-
-import jieba
+import pickle
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Set, Tuple, Union
+
+try:
+    # jieba_fast 为 C 实现的 jieba，接口与分词结果一致，安装后优先使用
+    import jieba_fast as jieba
+except ImportError:
+    import jieba
 from loguru import logger
 from rank_bm25 import BM25Okapi
+from scipy.sparse import csr_matrix
 import numpy as np
 
 
+# 模型文件格式版本，_SAVED_FIELDS 变化时递增；load() 拒绝版本不一致的文件
+MODEL_FORMAT_VERSION = 2
+
+# save() 写入模型文件的属性：训练后编码所需的参数、词汇表、IDF 与文档-词频 CSR 统计量
+# （原始语料、分词结果与 BM25Okapi 对象只在训练时使用，不写入文件）
+_SAVED_FIELDS = (
+    "k1", "b", "vocab", "idf", "idf_arr",
+    "doc_indptr", "doc_term_ids", "doc_term_freqs", "doc_len", "avgdl",
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """BM25 使用的分词函数（jieba 精确模式）"""
+    return jieba.lcut(text)
+
+
+@lru_cache(maxsize=10000)
+def _tokenize_query(query: str) -> Tuple[str, ...]:
+    """查询分词（缓存最近的查询，重复查询无需再次分词）"""
+    return tuple(tokenize(query))
+
+
 class BM25Sparse:
     """
     BM25 稀疏向量生成器
@@ -33,6 +63,14 @@ class BM25Sparse:
         self.tokenized_corpus: List[List[str]] = None
         self.vocab: Dict[str, int] = {}  # 词到索引的映射
         self.idf: Dict[str, float] = {}  # 词的 IDF 值
+        self.idf_arr: np.ndarray = None  # 按词索引排列的 IDF 数组
+        # 文档-词频 CSR 布局: 第 i 个文档的词索引为 doc_term_ids[doc_indptr[i]:doc_indptr[i+1]]
+        self.doc_indptr: np.ndarray = None
+        self.doc_term_ids: np.ndarray = None
+        self.doc_term_freqs: np.ndarray = None
+        self.doc_len: np.ndarray = None  # 各文档的词数
+        self.avgdl: float = 0.0  # 平均文档长度
+        self.is_fitted = False  # fit() 或 load() 后为 True
 
         logger.info(f"BM25 Sparse 模型初始化完成: k1={k1}, b={b}")
 
@@ -43,11 +81,22 @@ class BM25Sparse:
         Args:
             corpus: 文档列表
         """
-        self.corpus = corpus
-
         # 分词
         logger.info("正在对语料库进行分词...")
-        self.tokenized_corpus = [list(jieba.cut(doc)) for doc in corpus]
+        self.fit_pretokenized([tokenize(doc) for doc in corpus], corpus=corpus)
+
+    def fit_pretokenized(self, tokenized_corpus: List[List[str]], corpus: List[str] = None):
+        """
+        在已分词的语料库上训练 BM25 模型
+
+        分词结果需与 tokenize() 一致，调用方可复用分词结果，避免重复分词
+
+        Args:
+            tokenized_corpus: 分词后的文档列表
+            corpus: 原始文档列表（可选）
+        """
+        self.corpus = corpus
+        self.tokenized_corpus = tokenized_corpus
 
         # 构建词汇表
         logger.info("正在构建词汇表...")
@@ -62,58 +111,98 @@ class BM25Sparse:
         logger.info("正在训练 BM25 模型...")
         self.bm25 = BM25Okapi(self.tokenized_corpus, k1=self.k1, b=self.b)
 
+        # 构建文档-词频 CSR 布局（复用 BM25Okapi 统计好的词频）
+        self._build_term_matrix()
+
         # 计算 IDF
         self._compute_idf()
 
+        self.is_fitted = True
+
         logger.info("BM25 模型训练完成")
 
+    def _build_term_matrix(self):
+        """
+        将词频转换为扁平的 CSR 布局 (indptr, term_ids, term_freqs)
+
+        BM25Okapi.doc_freqs 已按文档保存 {词: 词频}，直接复用，不再重新计数
+        """
+        indptr = np.zeros(len(self.bm25.doc_freqs) + 1, dtype=np.int64)
+        term_ids: List[int] = []
+        term_freqs: List[int] = []
+        vocab = self.vocab
+
+        for i, counts in enumerate(self.bm25.doc_freqs):
+            term_ids.extend(vocab[token] for token in counts)
+            term_freqs.extend(counts.values())
+            indptr[i + 1] = len(term_ids)
+
+        self.doc_indptr = indptr
+        self.doc_term_ids = np.asarray(term_ids, dtype=np.int32)
+        self.doc_term_freqs = np.asarray(term_freqs, dtype=np.int32)
+
+        # 文档长度 = 该文档各词词频之和（按 CSR 前缀和相减，空文档为 0）
+        cum_freqs = np.concatenate(([0], np.cumsum(self.doc_term_freqs, dtype=np.int64)))
+        self.doc_len = cum_freqs[indptr[1:]] - cum_freqs[indptr[:-1]]
+        self.avgdl = float(self.doc_len.mean()) if len(self.doc_len) else 0.0
+
     def _compute_idf(self):
-        """计算每个词的 IDF 值"""
+        """计算每个词的 IDF 值（基于 CSR 布局统计文档频率，一次向量化计算）"""
         n_docs = len(self.tokenized_corpus)
-        doc_freq = defaultdict(int)
 
-        for doc_tokens in self.tokenized_corpus:
-            unique_tokens = set(doc_tokens)
-            for token in unique_tokens:
-                doc_freq[token] += 1
+        # CSR 中每个文档的词索引已去重，按词索引计数即为文档频率
+        doc_freq = np.bincount(self.doc_term_ids, minlength=len(self.vocab)).astype(np.float64)
+        self.idf_arr = np.log((n_docs - doc_freq + 0.5) / (doc_freq + 0.5) + 1)
 
-        for token in self.vocab:
-            self.idf[token] = np.log((n_docs - doc_freq[token] + 0.5) / (doc_freq[token] + 0.5) + 1)
+        # 保留 {词: IDF} 字典接口，供查询编码使用
+        self.idf = dict(zip(self.vocab, self.idf_arr.tolist()))
 
-    def encode_documents(self) -> List[Dict[int, float]]:
+    def encode_documents_csr(self) -> csr_matrix:
         """
-        将训练文档转换为稀疏向量
-
-        用于插入 Milvus 的 sparse_vector 字段
+        将训练文档转换为稀疏矩阵
 
         Returns:
-            List[Dict[int, float]]: 稀疏向量列表，每个向量是 {索引: 值} 的字典
+            csr_matrix: 形状为 (文档数, 词汇表大小) 的 BM25 权重矩阵，每行按最大值归一化
         """
-        if self.bm25 is None:
+        if not self.is_fitted:
             raise ValueError("请先调用 fit() 方法训练模型")
 
-        sparse_vectors = []
+        # 向量化计算 TF * IDF
+        weights = self.doc_term_freqs * self.idf_arr[self.doc_term_ids]
 
-        for doc_tokens in self.tokenized_corpus:
-            sparse_vec = {}
+        # 按文档取最大值归一化（IDF 恒为正，无需取绝对值）
+        indptr = self.doc_indptr
+        non_empty = np.diff(indptr) > 0
+        row_max = np.zeros(len(indptr) - 1, dtype=np.float64)
+        if weights.size:
+            row_max[non_empty] = np.maximum.reduceat(weights, indptr[:-1][non_empty])
+        safe_max = np.where(row_max > 0, row_max, 1.0)
+        weights = weights / np.repeat(safe_max, np.diff(indptr))
 
-            # 计算每个词的 BM25 分数
-            for token in set(doc_tokens):
-                if token in self.vocab:
-                    idx = self.vocab[token]
-                    # 使用 TF-IDF 作为稀疏向量值
-                    tf = doc_tokens.count(token)
-                    sparse_vec[idx] = tf * self.idf.get(token, 1.0)
+        return csr_matrix(
+            (weights, self.doc_term_ids, indptr),
+            shape=(len(indptr) - 1, len(self.vocab))
+        )
 
-            # 归一化
-            if sparse_vec:
-                max_val = max(abs(v) for v in sparse_vec.values())
-                if max_val > 0:
-                    sparse_vec = {k: v / max_val for k, v in sparse_vec.items()}
+    def encode_documents(self) -> List[Dict[int, float]]:
+        """
+        将训练文档转换为稀疏向量
+
+        用于插入 Milvus 的 sparse_vector 字段
+
+        Returns:
+            List[Dict[int, float]]: 稀疏向量列表，每个向量是 {索引: 值} 的字典
+        """
+        mat = self.encode_documents_csr()
 
-            sparse_vectors.append(sparse_vec)
+        term_ids = mat.indices.tolist()
+        values = mat.data.tolist()
+        bounds = mat.indptr.tolist()
 
-        return sparse_vectors
+        return [
+            dict(zip(term_ids[start:end], values[start:end]))
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
 
     def encode_query(self, query: str) -> Dict[int, float]:
         """
@@ -125,42 +214,113 @@ class BM25Sparse:
         Returns:
             Dict[int, float]: 稀疏向量 {词索引: 词权重}
         """
-        if self.bm25 is None:
+        return self.encode_queries([query])[0]
+
+    def encode_queries(self, queries: List[str]) -> List[Dict[int, float]]:
+        """
+        批量将查询转换为稀疏向量
+
+        词汇表、IDF 与 k1 在批次开始时取为局部变量，逐词循环中不再做属性查找
+
+        Args:
+            queries: 查询文本列表
+
+        Returns:
+            List[Dict[int, float]]: 稀疏向量列表 {词索引: 词权重}
+        """
+        if not self.is_fitted:
             raise ValueError("请先调用 fit() 方法训练模型")
 
-        # 分词
-        query_tokens = list(jieba.cut(query))
-
-        # 构建查询词的稀疏向量（正确格式：词索引 -> 词权重）
-        sparse_vec = {}
-        token_counts = {}
-
-        # 统计查询词频
-        for token in query_tokens:
-            token_counts[token] = token_counts.get(token, 0) + 1
-
-        # 计算每个查询词的权重（使用 BM25 查询词权重公式）
-        for token, count in token_counts.items():
-            if token in self.vocab:
-                idx = self.vocab[token]
-                # BM25 查询词权重 = IDF * (tf * (k1 + 1)) / (tf + k1)
-                tf = count
-                idf = self.idf.get(token, 1.0)
-                weight = idf * (tf * (self.k1 + 1)) / (tf + self.k1)
-                sparse_vec[idx] = weight
-
-        # 归一化
-        if sparse_vec:
-            max_val = max(abs(v) for v in sparse_vec.values())
+        vocab_get = self.vocab.get
+        idf_get = self.idf.get
+        k1 = self.k1
+        k1_plus_1 = k1 + 1
+
+        results = []
+        for query in queries:
+            # 构建查询词的稀疏向量（正确格式：词索引 -> 词权重）
+            sparse_vec = {}
+            max_val = 0.0
+
+            # BM25 查询词权重 = IDF * (tf * (k1 + 1)) / (tf + k1)
+            # IDF 恒为正，权重均为正数，构建时顺带记录最大值
+            for token, tf in Counter(_tokenize_query(query)).items():
+                idx = vocab_get(token)
+                if idx is not None:
+                    weight = idf_get(token, 1.0) * (tf * k1_plus_1) / (tf + k1)
+                    sparse_vec[idx] = weight
+                    if weight > max_val:
+                        max_val = weight
+
+            # 归一化
             if max_val > 0:
                 sparse_vec = {k: v / max_val for k, v in sparse_vec.items()}
 
-        return sparse_vec
+            results.append(sparse_vec)
+
+        return results
 
     def get_vocab_size(self) -> int:
         """获取词汇表大小"""
         return len(self.vocab)
 
+    def save(self, path: Union[str, Path]):
+        """
+        保存已训练的模型（参数、词汇表、IDF 与文档-词频 CSR 统计量，见 _SAVED_FIELDS）
+
+        原始语料、分词结果与 BM25Okapi 对象不写入文件，加载后的模型只用于编码
+
+        Args:
+            path: 保存路径
+        """
+        if not self.is_fitted:
+            raise ValueError("请先调用 fit() 方法训练模型")
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            state = {name: getattr(self, name) for name in _SAVED_FIELDS}
+            state["format_version"] = MODEL_FORMAT_VERSION
+            f.write(pickle.dumps(state, protocol=5))
+
+        logger.info(f"BM25 模型已保存: {path}")
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "BM25Sparse":
+        """
+        加载已训练的模型，无需重新分词和训练
+
+        Args:
+            path: 模型文件路径
+
+        Returns:
+            BM25Sparse: 已训练的模型
+
+        Raises:
+            ValueError: 模型文件格式版本与 MODEL_FORMAT_VERSION 不一致（如旧版保存的文件）
+        """
+        with open(path, "rb") as f:
+            state = pickle.loads(f.read())
+
+        version = state.get("format_version") if isinstance(state, dict) else None
+        if version != MODEL_FORMAT_VERSION:
+            raise ValueError(
+                f"BM25 模型文件格式版本不兼容: {path} (版本 {version}, 需要 {MODEL_FORMAT_VERSION})，"
+                f"请重新运行 02_build_indexes.py 生成"
+            )
+
+        model = cls.__new__(cls)
+        for name in _SAVED_FIELDS:
+            setattr(model, name, state[name])
+        # 训练时的中间数据不随模型保存
+        model.bm25 = None
+        model.corpus = None
+        model.tokenized_corpus = None
+        model.is_fitted = True
+
+        logger.info(f"BM25 模型已加载: {path}, 词汇表大小: {model.get_vocab_size()}")
+        return model
+
 
 class SparseEmbedding:
     """
@@ -173,10 +333,10 @@ class SparseEmbedding:
 
     def encode(self, texts: List[str]) -> List[Dict[int, float]]:
         """编码多个文本"""
-        if self.model.bm25 is None:
+        if not self.model.is_fitted:
             raise ValueError("请先训练模型")
-        # 对于查询，使用 encode_query
-        return [self.model.encode_query(text) for text in texts]
+        # 对于查询，使用批量的 encode_queries
+        return self.model.encode_queries(texts)
 
     def encode_single(self, text: str) -> Dict[int, float]:
         """编码单个文本"""
@@ -2,13 +2,13 @@
 文档分块模块
 """
 
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional
 from dataclasses import dataclass
 
 from loguru import logger
 
 
-@dataclass
+@dataclass(slots=True)
 class Chunk:
     """文档块"""
     doc_id: str
@@ -68,15 +68,26 @@ class DocumentChunker:
         Returns:
             List[Chunk]: 分块后的文档块列表
         """
-        all_chunks = []
-
-        for doc in documents:
-            chunks = self.chunk_single(doc)
-            all_chunks.extend(chunks)
+        all_chunks = list(self.iter_chunks(documents))
 
         logger.info(f"分块完成: {len(documents)} 个文档 -> {len(all_chunks)} 个块")
         return all_chunks
 
+    def iter_chunks(self, documents: Iterable[Dict]) -> Iterator[Chunk]:
+        """
+        逐个产出文档块
+
+        文档可以是迭代器，分块结果边生成边消费，无需一次性持有全部块
+
+        Args:
+            documents: 文档序列，每个文档包含 doc_id, title, content, metadata
+
+        Yields:
+            Chunk: 文档块
+        """
+        for doc in documents:
+            yield from self.chunk_single(doc)
+
     def chunk_single(self, document: Dict) -> List[Chunk]:
         """
         对单个文档进行分块
@@ -102,32 +113,42 @@ class DocumentChunker:
         sections = full_content.split(self.separator)
         sections = [s.strip() for s in sections if s.strip()]
 
+        # 当前块以段落列表累积，记录拼接后的长度，只在输出时 join 一次
+        separator = self.separator
+        sep_len = len(separator)
+        chunk_size = self.chunk_size
+        chunk_overlap = self.chunk_overlap
+
         chunks = []
-        current_chunk = ""
-        chunk_index = 0
+        current_parts: List[str] = []
+        current_len = 0
 
         for section in sections:
             # 如果当前块加上新段落超过大小限制，先保存当前块
-            if current_chunk and len(current_chunk) + len(section) + len(self.separator) > self.chunk_size:
+            if current_parts and current_len + len(section) + sep_len > chunk_size:
+                current_chunk = separator.join(current_parts)
                 chunks.append(current_chunk.strip())
                 # 保留重叠部分
-                if self.chunk_overlap > 0:
-                    current_chunk = current_chunk[-self.chunk_overlap:] + self.separator + section
+                if chunk_overlap > 0:
+                    overlap_tail = current_chunk[-chunk_overlap:]
+                    current_parts = [overlap_tail, section]
+                    current_len = len(overlap_tail) + sep_len + len(section)
                 else:
-                    current_chunk = section
-                chunk_index += 1
+                    current_parts = [section]
+                    current_len = len(section)
 
                 if len(chunks) >= self.max_chunks_per_doc:
                     break
             else:
-                if current_chunk:
-                    current_chunk += self.separator + section
+                if current_parts:
+                    current_len += sep_len + len(section)
                 else:
-                    current_chunk = section
+                    current_len = len(section)
+                current_parts.append(section)
 
         # 添加最后一个块
-        if current_chunk and len(chunks) < self.max_chunks_per_doc:
-            chunks.append(current_chunk.strip())
+        if current_parts and len(chunks) < self.max_chunks_per_doc:
+            chunks.append(separator.join(current_parts).strip())
 
         # 创建 Chunk 对象
         chunk_objects = []
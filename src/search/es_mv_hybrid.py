@@ -7,13 +7,70 @@ ES + MV 混合检索器
 - 结果融合: 应用层 RRF
 """
 
-from collections import defaultdict
-from typing import Dict, List, Optional
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from sys import intern
+from typing import Callable, Dict, Hashable, List, Optional
+
+import numpy as np
 
 from loguru import logger
 from pymilvus import Collection
 
 from src.database.es_client import ESClient
+from src.search.fusion import candidate_limit, fuse_rrf, top_k_items
+from src.search.hybrid_search import CANDIDATE_FIELDS, fetch_by_chunk_ids
+
+# Dense 检索返回的标量字段
+OUTPUT_FIELDS = ["doc_id", "chunk_id", "title", "content", "metadata"]
+
+# 融合后为只来自 Dense 一路的结果补全的字段（混合检索中 Dense 候选只拉取 CANDIDATE_FIELDS）
+HYDRATE_FIELDS = ["title", "content"]
+
+# 单路检索结果缓存的默认容量：默认不缓存；开启后同一会话内重复查询不再重复请求 ES / Milvus
+SEARCH_CACHE_SIZE = 0
+
+# 单路检索结果缓存的默认有效期（秒），索引在其他进程中重建后，过期的缓存结果最多保留这么久
+SEARCH_CACHE_TTL = 300.0
+
+
+class _LRUCache:
+    """线程安全的 LRU 缓存，可选 TTL（秒，按写入时间计算）"""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        """命中时返回缓存值并标记为最近使用，未命中或已过期时返回 None"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.ttl is not None and time.monotonic() - stored_at >= self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的项"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
 
 
 class ESMVHybridSearcher:
@@ -29,7 +86,9 @@ class ESMVHybridSearcher:
         self,
         es_client: ESClient,
         milvus_collection: Collection,
-        dense_search_field: str = "dense_vector"
+        dense_search_field: str = "dense_vector",
+        cache_size: int = SEARCH_CACHE_SIZE,
+        cache_ttl: Optional[float] = SEARCH_CACHE_TTL
     ):
         """
         初始化 ES + MV 混合检索器
@@ -38,13 +97,26 @@ class ESMVHybridSearcher:
             es_client: Elasticsearch 客户端
             milvus_collection: Milvus Collection 对象
             dense_search_field: Dense 向量字段名
+            cache_size: 单路检索结果缓存容量，默认 0 表示不缓存
+            cache_ttl: 缓存有效期（秒）；None 表示不过期，仅在索引只读时使用。
+                同一进程内重建或更新 ES / Milvus 索引后需调用 clear_cache
         """
         self.es_client = es_client
         self.collection = milvus_collection
         self.dense_search_field = dense_search_field
+        # 检索参数只构建一次，各次检索共用
+        self._dense_params = {"metric_type": "IP", "params": {"ef": 256}}
+        # ES 缓存键为 (query, top_k)，Dense 缓存键为 (float32 向量字节, top_k, expr, 返回字段)
+        self._es_cache = _LRUCache(cache_size, cache_ttl)
+        self._dense_cache = _LRUCache(cache_size, cache_ttl)
 
         logger.info("ES+MV 混合检索器初始化完成")
 
+    def clear_cache(self) -> None:
+        """清空 ES / Dense 检索结果缓存（索引数据更新后调用）"""
+        self._es_cache.clear()
+        self._dense_cache.clear()
+
     def es_fulltext_search(
         self,
         query: str,
@@ -60,25 +132,48 @@ class ESMVHybridSearcher:
         Returns:
             List[Dict]: 检索结果列表
         """
-        try:
-            results = self.es_client.search(query, top_k=top_k)
+        return self.es_fulltext_search_batch([query], top_k=top_k)[0]
 
-            # 转换为统一格式
-            formatted_results = []
-            for r in results:
-                formatted_results.append({
-                    "doc_id": r["doc_id"],
-                    "chunk_id": r["chunk_id"],
-                    "title": r["title"],
-                    "content": r["content"],
-                    "score": r["score"]
-                })
+    def es_fulltext_search_batch(
+        self,
+        queries: List[str],
+        top_k: int = 10
+    ) -> List[List[Dict]]:
+        """
+        Elasticsearch 批量全文检索
 
-            return formatted_results
+        通过 msearch 一次 HTTP 请求提交所有查询，结果已是统一格式
+        (doc_id, chunk_id, title, content, score)。
+        已缓存的查询不再请求，只提交未命中的查询；检索失败时不写入缓存
 
-        except Exception as e:
-            logger.error(f"ES 检索失败: {e}")
-            return []
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回结果数量
+
+        Returns:
+            List[List[Dict]]: 与查询顺序一致的检索结果列表
+        """
+        keys = [(query, top_k) for query in queries]
+        batch = [self._es_cache.get(key) for key in keys]
+        missing = [i for i, hits in enumerate(batch) if hits is None]
+
+        if missing:
+            try:
+                fetched = self.es_client.search_batch([queries[i] for i in missing], top_k=top_k)
+
+            except Exception as e:
+                logger.error(f"ES 检索失败: {e}")
+                fetched = None
+
+            for j, i in enumerate(missing):
+                if fetched is None:
+                    batch[i] = []
+                else:
+                    batch[i] = fetched[j]
+                    self._es_cache.put(keys[i], fetched[j])
+
+        # 返回列表副本，调用方修改结果列表不影响缓存
+        return [list(hits) for hits in batch]
 
     def dense_search(
         self,
@@ -97,32 +192,93 @@ class ESMVHybridSearcher:
         Returns:
             List[Dict]: 检索结果列表
         """
-        search_params = {
-            "metric_type": "IP",
-            "params": {"ef": 256}
-        }
-
-        results = self.collection.search(
-            data=[query_vector],
-            anns_field=self.dense_search_field,
-            param=search_params,
-            limit=top_k,
-            expr=expr,
-            output_fields=["doc_id", "chunk_id", "title", "content", "metadata"]
-        )
-
-        # 转换为统一格式
-        formatted_results = []
-        for hit in results[0]:
-            formatted_results.append({
-                "doc_id": hit.entity.get("doc_id"),
-                "chunk_id": hit.entity.get("chunk_id"),
-                "title": hit.entity.get("title"),
-                "content": hit.entity.get("content"),
-                "score": hit.score
-            })
+        return self.dense_search_batch([query_vector], top_k=top_k, expr=expr)[0]
+
+    def dense_search_batch(
+        self,
+        query_vectors: List[List[float]],
+        top_k: int = 10,
+        expr: Optional[str] = None
+    ) -> List[List[Dict]]:
+        """
+        Milvus 批量 Dense 向量检索
 
-        return formatted_results
+        一次 RPC 提交所有未命中缓存的查询向量
+
+        Args:
+            query_vectors: 查询向量列表（或二维数组）
+            top_k: 每个查询返回结果数量
+            expr: 过滤表达式
+
+        Returns:
+            List[List[Dict]]: 与查询顺序一致的检索结果列表
+        """
+        return self._submit_dense_search(query_vectors, top_k, expr, OUTPUT_FIELDS)()
+
+    def _submit_dense_search(
+        self,
+        query_vectors: List[List[float]],
+        top_k: int,
+        expr: Optional[str],
+        output_fields: List[str]
+    ) -> Callable[[], List[List[Dict]]]:
+        """
+        发起批量 Dense 检索并立即返回
+
+        未命中缓存的向量以 _async=True 一次提交，返回的函数等待 SearchFuture 完成、
+        转换为统一格式并写入缓存，调用方可在此期间执行 ES 检索。
+        未请求的字段在结果中为 None
+
+        Returns:
+            Callable[[], List[List[Dict]]]: 调用后得到与查询顺序一致的检索结果列表
+        """
+        n = len(query_vectors)
+        fields_key = tuple(output_fields)
+        keys = [
+            (np.asarray(query_vectors[i], dtype=np.float32).tobytes(), top_k, expr, fields_key)
+            for i in range(n)
+        ]
+        batch = [self._dense_cache.get(key) for key in keys]
+        missing = [i for i, hits in enumerate(batch) if hits is None]
+
+        future = None
+        if missing:
+            future = self.collection.search(
+                data=[query_vectors[i] for i in missing],
+                anns_field=self.dense_search_field,
+                param=self._dense_params,
+                limit=top_k,
+                expr=expr,
+                output_fields=output_fields,
+                _async=True
+            )
+
+        def collect() -> List[List[Dict]]:
+            if future is not None:
+                for i, hits in zip(missing, self._format_dense_hits(future.result())):
+                    batch[i] = hits
+                    self._dense_cache.put(keys[i], hits)
+            # 返回列表副本，调用方修改结果列表不影响缓存
+            return [list(hits) for hits in batch]
+
+        return collect
+
+    @staticmethod
+    def _format_dense_hits(results) -> List[List[Dict]]:
+        """将 Milvus 批量检索结果转换为统一格式"""
+        return [
+            [
+                {
+                    "doc_id": hit.entity.get("doc_id"),
+                    "chunk_id": hit.entity.get("chunk_id"),
+                    "title": hit.entity.get("title"),
+                    "content": hit.entity.get("content"),
+                    "score": hit.score
+                }
+                for hit in hits
+            ]
+            for hits in results
+        ]
 
     def hybrid_search(
         self,
@@ -132,11 +288,17 @@ class ESMVHybridSearcher:
         rrf_k: int = 60,
         es_weight: float = 0.5,
         dense_weight: float = 0.5,
-        fusion_method: str = "rrf"
+        fusion_method: str = "rrf",
+        output_fields: Optional[List[str]] = None,
+        expr: Optional[str] = None,
+        candidate_k: Optional[int] = None
     ) -> List[Dict]:
         """
         ES + MV 混合检索（应用层 RRF 融合）
 
+        两路检索相互独立且均为网络 I/O：Milvus 一路以 _async=True 先发起，
+        ES 一路在当前线程执行，无需线程池，延迟约为两者中的较大值
+
         Args:
             query: 原始查询文本（用于 ES）
             query_dense: Dense 查询向量（用于 MV）
@@ -145,13 +307,20 @@ class ESMVHybridSearcher:
             es_weight: ES 权重（用于 weighted 融合）
             dense_weight: Dense 权重（用于 weighted 融合）
             fusion_method: 融合方法，"rrf" 或 "weighted"
+            output_fields: 需要的返回字段，默认全部；不含 title / content 时不为 Dense 一路的结果补全正文，
+                省去融合后的一次 Milvus 查询（结果中仍带有 doc_id / chunk_id 与分数）
+            expr: Milvus 过滤表达式（仅作用于 Dense 一路）
+            candidate_k: 每路拉取的候选数量，默认 top_k * 2；候选较深（不少于 64 且不少于 top_k 的 4 倍）时 RRF 融合可提前终止
 
         Returns:
             List[Dict]: 融合后的检索结果列表
         """
-        # 执行两路检索，获取更多结果用于融合
-        es_results = self.es_fulltext_search(query, top_k=top_k * 2)
-        dense_results = self.dense_search(query_dense, top_k=top_k * 2)
+        # 并行执行两路检索，获取更多结果用于融合
+        # Dense 候选只拉取 ID，融合后再为入选结果补全正文
+        limit = candidate_limit(top_k, candidate_k)
+        collect_dense = self._submit_dense_search([query_dense], limit, expr, CANDIDATE_FIELDS)
+        es_results = self.es_fulltext_search(query, top_k=limit)
+        dense_results = collect_dense()[0]
 
         # 结果融合
         if fusion_method == "rrf":
@@ -161,9 +330,105 @@ class ESMVHybridSearcher:
                 es_results, dense_results, top_k, es_weight, dense_weight
             )
 
+        self._hydrate([fused_results], self._hydrate_fields(output_fields))
+
         logger.debug(f"ES+MV 混合检索完成: ES={len(es_results)}, Dense={len(dense_results)}, Fused={len(fused_results)}")
         return fused_results
 
+    def hybrid_search_batch(
+        self,
+        queries: List[str],
+        query_denses: List[List[float]],
+        top_k: int = 10,
+        rrf_k: int = 60,
+        es_weight: float = 0.5,
+        dense_weight: float = 0.5,
+        fusion_method: str = "rrf",
+        output_fields: Optional[List[str]] = None,
+        expr: Optional[str] = None,
+        candidate_k: Optional[int] = None
+    ) -> List[List[Dict]]:
+        """
+        批量 ES + MV 混合检索
+
+        ES 一路为一次 msearch，Milvus 一路为一次异步批量检索，两者并行执行后逐查询融合
+
+        Args:
+            queries: 查询文本列表（用于 ES）
+            query_denses: 与 queries 对应的 Dense 查询向量（用于 MV）
+            top_k: 每个查询返回结果数量
+            rrf_k: RRF 参数 k
+            es_weight: ES 权重（用于 weighted 融合）
+            dense_weight: Dense 权重（用于 weighted 融合）
+            fusion_method: 融合方法，"rrf" 或 "weighted"
+            output_fields: 需要的返回字段，默认全部；不含 title / content 时不为 Dense 一路的结果补全正文，
+                省去融合后的一次 Milvus 查询（结果中仍带有 doc_id / chunk_id 与分数）
+            expr: Milvus 过滤表达式（仅作用于 Dense 一路）
+            candidate_k: 每路拉取的候选数量，默认 top_k * 2；候选较深（不少于 64 且不少于 top_k 的 4 倍）时 RRF 融合可提前终止
+
+        Returns:
+            List[List[Dict]]: 与查询顺序一致的融合结果列表
+        """
+        if not queries:
+            return []
+
+        limit = candidate_limit(top_k, candidate_k)
+        collect_dense = self._submit_dense_search(query_denses, limit, expr, CANDIDATE_FIELDS)
+        es_batch = self.es_fulltext_search_batch(queries, top_k=limit)
+        dense_batch = collect_dense()
+
+        if fusion_method == "rrf":
+            fused_batch = [
+                self._rrf_fusion(es_results, dense_results, top_k, rrf_k)
+                for es_results, dense_results in zip(es_batch, dense_batch)
+            ]
+        else:
+            fused_batch = [
+                self._weighted_fusion(es_results, dense_results, top_k, es_weight, dense_weight)
+                for es_results, dense_results in zip(es_batch, dense_batch)
+            ]
+
+        # 所有查询中只来自 Dense 一路的结果一次补全
+        self._hydrate(fused_batch, self._hydrate_fields(output_fields))
+        return fused_batch
+
+    @staticmethod
+    def _hydrate_fields(output_fields: Optional[List[str]]) -> List[str]:
+        """融合后需要为只来自 Dense 一路的结果补全的字段（HYDRATE_FIELDS 中被请求的部分）"""
+        if output_fields is None:
+            return HYDRATE_FIELDS
+        return [f for f in HYDRATE_FIELDS if f in output_fields]
+
+    def _hydrate(self, fused_batch: List[List[Dict]], fields: List[str]) -> None:
+        """
+        为只来自 Dense 一路的融合结果补全 title / content（原地更新）
+
+        ES 一路的结果自带正文；Dense 候选只拉取 ID，被融合淘汰的候选不再传输正文
+
+        Args:
+            fused_batch: 各查询的融合结果
+            fields: 需要补全的字段，为空时不发起查询
+        """
+        if not fields:
+            return
+
+        pending = [result for results in fused_batch for result in results if result.get("content") is None]
+        if not pending:
+            return
+
+        chunk_ids = list(dict.fromkeys(result["chunk_id"] for result in pending))
+        try:
+            rows = fetch_by_chunk_ids(self.collection, chunk_ids, fields)
+        except Exception as e:
+            logger.error(f"Dense 结果补全失败: {e}")
+            return
+
+        for result in pending:
+            row = rows.get(result["chunk_id"])
+            if row is not None:
+                for f in fields:
+                    result[f] = row.get(f)
+
     def _rrf_fusion(
         self,
         es_results: List[Dict],
@@ -185,34 +450,24 @@ class ESMVHybridSearcher:
         Returns:
             List[Dict]: 融合后的结果
         """
-        scores = defaultdict(float)
-        doc_data: Dict[str, Dict] = {}
-
-        # 处理 ES 结果
-        for rank, result in enumerate(es_results, 1):
-            doc_id = result["chunk_id"]
-            scores[doc_id] += 1.0 / (k + rank)
-            if doc_id not in doc_data:
-                doc_data[doc_id] = result
-
-        # 处理 Dense 结果
-        for rank, result in enumerate(dense_results, 1):
-            doc_id = result["chunk_id"]
-            scores[doc_id] += 1.0 / (k + rank)
-            if doc_id not in doc_data:
-                doc_data[doc_id] = result
-
-        # 排序
-        sorted_docs = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        # 按候选规模选择融合内核，结果为 (路序号, 排名下标, 分数)，映射回对应的检索结果
+        legs = (es_results, dense_results)
+        ranked = [
+            (legs[leg][rank], score)
+            for leg, rank, score in fuse_rrf(
+                [r["chunk_id"] for r in es_results], [r["chunk_id"] for r in dense_results], k, top_k
+            )
+        ]
 
         # 创建融合结果
         fused_results = []
-        for doc_id, rrf_score in sorted_docs[:top_k]:
-            result = doc_data[doc_id].copy()
-            result["fusion_score"] = rrf_score
-            result["fusion_method"] = "es_mv_rrf"
-            result["source"] = "ES+MV"
-            fused_results.append(result)
+        for result, rrf_score in ranked:
+            fused_results.append({
+                **result,
+                "fusion_score": rrf_score,
+                "fusion_method": "es_mv_rrf",
+                "source": "ES+MV"
+            })
 
         return fused_results
 
@@ -241,15 +496,12 @@ class ESMVHybridSearcher:
         doc_data: Dict[str, Dict] = {}
 
         # 获取分数并归一化
-        es_scores = {r["chunk_id"]: r["score"] for r in es_results}
-        dense_scores = {r["chunk_id"]: r["score"] for r in dense_results}
-
-        max_es = max(es_scores.values()) if es_scores else 1.0
-        max_dense = max(dense_scores.values()) if dense_scores else 1.0
+        max_es = max((r["score"] for r in es_results), default=1.0)
+        max_dense = max((r["score"] for r in dense_results), default=1.0)
 
         # 融合 ES 结果
         for result in es_results:
-            doc_id = result["chunk_id"]
+            doc_id = intern(result["chunk_id"])
             es_norm = result["score"] / max_es
             scores[doc_id] += es_weight * es_norm
             if doc_id not in doc_data:
@@ -257,7 +509,7 @@ class ESMVHybridSearcher:
 
         # 融合 Dense 结果
         for result in dense_results:
-            doc_id = result["chunk_id"]
+            doc_id = intern(result["chunk_id"])
             dense_norm = result["score"] / max_dense
             if doc_id in scores:
                 scores[doc_id] += dense_weight * dense_norm
@@ -265,17 +517,18 @@ class ESMVHybridSearcher:
                 scores[doc_id] = dense_weight * dense_norm
                 doc_data[doc_id] = result
 
-        # 排序
-        sorted_docs = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        # 取前 top_k（堆选取，无需对全部候选排序）
+        sorted_docs = top_k_items(scores, top_k)
 
         # 创建融合结果
         fused_results = []
-        for doc_id, fusion_score in sorted_docs[:top_k]:
-            result = doc_data[doc_id].copy()
-            result["fusion_score"] = fusion_score
-            result["fusion_method"] = "es_mv_weighted"
-            result["source"] = "ES+MV"
-            fused_results.append(result)
+        for doc_id, fusion_score in sorted_docs:
+            fused_results.append({
+                **doc_data[doc_id],
+                "fusion_score": fusion_score,
+                "fusion_method": "es_mv_weighted",
+                "source": "ES+MV"
+            })
 
         return fused_results
 
@@ -0,0 +1,264 @@
+"""
+检索结果融合公共工具
+
+RRF 权重查表、top-k 选取、深候选列表的提前终止 RRF、大候选集的向量化 RRF 及按规模选择内核的 fuse_rrf，供 HybridSearcher / ESMVHybridSearcher 共用
+"""
+
+import heapq
+from collections import defaultdict
+from functools import lru_cache
+from itertools import zip_longest
+from operator import itemgetter
+from sys import intern
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 预计算 RRF 权重的排名范围，超出时按需计算
+RRF_TABLE_SIZE = 1024
+
+# 两路候选总数达到该值时，RRF 改用 NumPy 向量化内核
+NUMPY_RRF_MIN_CANDIDATES = 512
+
+# 单路候选深度达到该值、且 top_k 不超过深度的 1 / EARLY_EXIT_DEPTH_RATIO 时，RRF 使用提前终止
+# （候选较浅时逐条累加更快）
+EARLY_EXIT_MIN_DEPTH = 64
+EARLY_EXIT_DEPTH_RATIO = 4
+
+
+def use_early_exit(depth: int, top_k: int) -> bool:
+    """判断 RRF 是否使用提前终止（depth 为两路中较长一路的长度）"""
+    return depth >= EARLY_EXIT_MIN_DEPTH and 0 < top_k * EARLY_EXIT_DEPTH_RATIO <= depth
+
+
+def candidate_limit(top_k: int, candidate_k: Optional[int] = None) -> int:
+    """混合检索每路拉取的候选数量：未指定时为 top_k * 2，指定时不少于 top_k"""
+    if not candidate_k:
+        return top_k * 2
+    return max(candidate_k, top_k)
+
+
+@lru_cache(maxsize=16)
+def _rrf_table(k: int) -> Tuple[float, ...]:
+    """RRF 权重表: table[rank - 1] = 1 / (k + rank)"""
+    return tuple(1.0 / (k + rank) for rank in range(1, RRF_TABLE_SIZE + 1))
+
+
+def rrf_weights(k: int, n: int) -> Sequence[float]:
+    """
+    获取前 n 个排名的 RRF 权重
+
+    Args:
+        k: RRF 参数
+        n: 需要的排名数
+
+    Returns:
+        Sequence[float]: 第 i 项为排名 i + 1 的权重 1 / (k + i + 1)
+    """
+    if n <= RRF_TABLE_SIZE:
+        return _rrf_table(k)
+    return [1.0 / (k + rank) for rank in range(1, n + 1)]
+
+
+def top_k_items(scores: Dict[str, float], top_k: int) -> List[Tuple[str, float]]:
+    """
+    按分数取前 top_k 项
+
+    heapq.nlargest 为 O(N log K)，结果（含同分时的先后顺序）与
+    sorted(..., reverse=True)[:top_k] 一致
+
+    Args:
+        scores: ID -> 融合分数
+        top_k: 返回数量
+
+    Returns:
+        List[Tuple[str, float]]: 按分数降序的 (ID, 分数) 列表
+    """
+    return heapq.nlargest(top_k, scores.items(), key=itemgetter(1))
+
+
+def rrf_top_k(id_lists: Sequence[Sequence[str]], k: int, top_k: int) -> List[Tuple[int, float]]:
+    """
+    NumPy 向量化的 RRF 融合（候选数量较大时使用）
+
+    各路 ID 拼接后用 np.unique 编码为整数，np.add.at 按路累加权重，
+    分区选出前 top_k 后再排序。同分时按 ID 首次出现的位置排序，
+    分数与先后顺序均与逐条累加 + top_k_items 一致
+
+    Args:
+        id_lists: 各路检索结果的 ID 列表（按排名排列）
+        k: RRF 参数
+        top_k: 返回数量
+
+    Returns:
+        List[Tuple[int, float]]: 按分数降序的 (拼接后首次出现的位置, RRF 分数) 列表
+    """
+    all_ids = np.array([doc_id for ids in id_lists for doc_id in ids], dtype=object)
+    if all_ids.size == 0 or top_k <= 0:
+        return []
+
+    _, first_pos, codes = np.unique(all_ids, return_index=True, return_inverse=True)
+    weights = np.concatenate([
+        1.0 / (k + np.arange(1, len(ids) + 1, dtype=np.float64)) for ids in id_lists
+    ])
+    scores = np.zeros(len(first_pos), dtype=np.float64)
+    np.add.at(scores, codes.ravel(), weights)
+
+    # 先按第 top_k 大的分数截取候选（保留与其同分的全部 ID），再按 (分数降序, 首次出现位置) 排序
+    n_unique = len(scores)
+    if top_k < n_unique:
+        kth = np.partition(scores, n_unique - top_k)[n_unique - top_k]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(n_unique)
+    order = candidates[np.lexsort((first_pos[candidates], -scores[candidates]))][:top_k]
+
+    return list(zip(first_pos[order].tolist(), scores[order].tolist()))
+
+
+def rrf_top_k_early(
+    first_ids: Sequence[str],
+    second_ids: Sequence[str],
+    k: int,
+    top_k: int
+) -> List[Tuple[int, int, float]]:
+    """
+    带提前终止的两路 RRF 融合
+
+    两路按排名同步推进（提前终止后剩余排名不再处理）：两路都已出现的 ID
+    分数已确定，放入大小为 top_k 的小顶堆（heapreplace 更新）；只出现在一路的 ID 仍可能在
+    另一路的后续排名中加分。在第 r 名之后，未确定 ID 的分数上界为「未确定 ID 中的最高单路权重 +
+    第 r + 1 名权重」（尚未出现的 ID 上界为两倍第 r + 1 名权重），堆顶严格大于该上界时剩余排名
+    已不影响前 top_k 的成员和顺序，直接返回。
+    结果（分数与同分时按首次出现位置的先后顺序）与 rrf_top_k 一致；
+    上界要求每一路内 ID 不重复，而重复可能出现在终止点之后，因此先检查两路是否各自无重复；
+    存在同路重复时不做提前终止，直接按拼接顺序逐条累加
+
+    Args:
+        first_ids: 第一路检索结果的 ID 列表（按排名排列）
+        second_ids: 第二路检索结果的 ID 列表（按排名排列）
+        k: RRF 参数
+        top_k: 返回数量
+
+    Returns:
+        List[Tuple[int, int, float]]: 按分数降序的 (首次出现的路序号, 该路中的排名下标, RRF 分数) 列表
+    """
+    if top_k <= 0:
+        return []
+
+    # 超出权重表的排名按需计算
+    table = _rrf_table(k)
+    last = RRF_TABLE_SIZE - 1
+
+    if len(set(first_ids)) != len(first_ids) or len(set(second_ids)) != len(second_ids):
+        # 存在同路重复：按两路拼接顺序逐条累加（与 rrf_top_k 及逐条累加的浮点结果一致）
+        totals: Dict[str, float] = defaultdict(float)
+        first_seen: Dict[str, Tuple[int, int]] = {}
+        for leg, ids in enumerate((first_ids, second_ids)):
+            for rank, doc_id in enumerate(ids):
+                totals[doc_id] += table[rank] if rank <= last else 1.0 / (k + rank + 1)
+                if doc_id not in first_seen:
+                    first_seen[doc_id] = (leg, rank)
+        best = heapq.nlargest(
+            top_k, ((score, -first_seen[doc_id][0], -first_seen[doc_id][1]) for doc_id, score in totals.items())
+        )
+        return [(-neg_leg, -neg_rank, score) for score, neg_leg, neg_rank in best]
+
+    scores: Dict[str, float] = {}
+    # ID -> 首次出现位置 (路序号, 排名下标)，元组比较即为两路拼接后的先后顺序
+    first_pos: Dict[str, Tuple[int, int]] = {}
+    # 只出现在一路的 ID -> 该路序号；另一路也出现、分数确定后置为 None
+    pending_leg: Dict[str, Optional[int]] = {}
+    # 分数已确定的 ID: (分数, -路序号, -排名下标) 小顶堆，保留最大的 top_k 个
+    settled: List[Tuple[float, int, int]] = []
+    # 未确定 ID 的 (排名, ID) 堆，分数已确定的 ID 在堆顶时惰性删除
+    pending: List[Tuple[int, str]] = []
+
+    for rank, pair in enumerate(zip_longest(first_ids, second_ids)):
+        weight = table[rank] if rank <= last else 1.0 / (k + rank + 1)
+        for leg, doc_id in enumerate(pair):
+            if doc_id is None:
+                continue
+            if doc_id not in scores:
+                scores[doc_id] = weight
+                first_pos[doc_id] = (leg, rank)
+                pending_leg[doc_id] = leg
+                heapq.heappush(pending, (rank, doc_id))
+                continue
+
+            # 两路各自无重复，再次出现必为另一路，分数确定
+            score = scores[doc_id] = scores[doc_id] + weight
+            pending_leg[doc_id] = None
+            pos = first_pos[doc_id] = min(first_pos[doc_id], (leg, rank))
+            item = (score, -pos[0], -pos[1])
+            if len(settled) < top_k:
+                heapq.heappush(settled, item)
+            elif item > settled[0]:
+                heapq.heapreplace(settled, item)
+
+        if len(settled) == top_k:
+            while pending and pending_leg[pending[0][1]] is None:
+                heapq.heappop(pending)
+            next_weight = table[rank + 1] if rank < last else 1.0 / (k + rank + 2)
+            if pending:
+                best_rank = pending[0][0]
+                bound = (table[best_rank] if best_rank <= last else 1.0 / (k + best_rank + 1)) + next_weight
+            else:
+                bound = next_weight + next_weight
+            if settled[0][0] > bound:
+                return [(-neg_leg, -neg_rank, score) for score, neg_leg, neg_rank in sorted(settled, reverse=True)]
+
+    best = heapq.nlargest(
+        top_k, ((score, -first_pos[doc_id][0], -first_pos[doc_id][1]) for doc_id, score in scores.items())
+    )
+    return [(-neg_leg, -neg_rank, score) for score, neg_leg, neg_rank in best]
+
+
+def fuse_rrf(
+    first_ids: Sequence[str],
+    second_ids: Sequence[str],
+    k: int,
+    top_k: int
+) -> List[Tuple[int, int, float]]:
+    """
+    两路 RRF 融合入口，按候选规模选择内核
+
+    候选总数达到 NUMPY_RRF_MIN_CANDIDATES 时使用 NumPy 向量化内核；单路较深且 top_k 较小时
+    使用提前终止内核；其余情况逐条累加。三种内核的分数与同分时的先后顺序一致
+
+    Args:
+        first_ids: 第一路检索结果的 ID 列表（按排名排列）
+        second_ids: 第二路检索结果的 ID 列表（按排名排列）
+        k: RRF 参数
+        top_k: 返回数量
+
+    Returns:
+        List[Tuple[int, int, float]]: 按分数降序的 (首次出现的路序号, 该路中的排名下标, RRF 分数) 列表
+    """
+    n_first = len(first_ids)
+    if n_first + len(second_ids) >= NUMPY_RRF_MIN_CANDIDATES:
+        # 拼接后的位置换算回 (路序号, 排名下标)
+        return [
+            (0, pos, score) if pos < n_first else (1, pos - n_first, score)
+            for pos, score in rrf_top_k([first_ids, second_ids], k, top_k)
+        ]
+
+    if use_early_exit(max(n_first, len(second_ids)), top_k):
+        return rrf_top_k_early(first_ids, second_ids, k, top_k)
+
+    scores: Dict[str, float] = defaultdict(float)
+    first_seen: Dict[str, Tuple[int, int]] = {}
+
+    # RRF 权重查表，循环内不再做除法
+    weights = rrf_weights(k, max(n_first, len(second_ids)))
+
+    # ID 驻留后，两路结果中相同的 ID 为同一对象，字典查找只需比较身份
+    for leg, ids in enumerate((first_ids, second_ids)):
+        for rank, (weight, doc_id) in enumerate(zip(weights, ids)):
+            doc_id = intern(doc_id)
+            scores[doc_id] += weight
+            if doc_id not in first_seen:
+                first_seen[doc_id] = (leg, rank)
+
+    # 取前 top_k（堆选取，同分时保持首次出现的先后顺序）
+    return [(*first_seen[doc_id], score) for doc_id, score in top_k_items(scores, top_k)]
@@ -2,33 +2,73 @@
 混合检索和 RRF 融合模块
 """
 
+import json
 from collections import defaultdict
+from dataclasses import dataclass, field, replace
+from sys import intern
 from typing import Dict, List, Optional, Tuple
 
 from loguru import logger
 from pymilvus import Collection
 
+from src.search.fusion import candidate_limit, fuse_rrf, top_k_items
 
+# 默认返回的标量字段
+DEFAULT_OUTPUT_FIELDS = ["doc_id", "chunk_id", "title", "content", "metadata"]
+
+# 混合检索两路候选只拉取的字段；其余字段（title / content / metadata）在融合后只为最终结果补全
+CANDIDATE_FIELDS = ["doc_id", "chunk_id"]
+
+
+def fetch_by_chunk_ids(collection: Collection, chunk_ids: List[str], fields: List[str]) -> Dict[str, dict]:
+    """
+    按 chunk_id 批量拉取标量字段
+
+    建索引时主键 id 即 chunk_id（见 02_build_indexes），按主键查询，一次 RPC 完成
+
+    Args:
+        collection: Milvus Collection 对象
+        chunk_ids: 需要拉取的 chunk_id 列表
+        fields: 需要拉取的字段
+
+    Returns:
+        Dict[str, dict]: chunk_id -> 字段值
+    """
+    if not chunk_ids or not fields:
+        return {}
+
+    rows = collection.query(
+        expr=f"id in {json.dumps(chunk_ids, ensure_ascii=False)}",
+        output_fields=["chunk_id", *fields]
+    )
+    return {row["chunk_id"]: row for row in rows}
+
+
+@dataclass(slots=True)
 class SearchResult:
     """检索结果"""
 
-    def __init__(
-        self,
-        doc_id: str,
-        chunk_id: str,
-        title: str,
-        content: str,
-        score: float,
-        distance: Optional[float] = None,
-        metadata: Optional[dict] = None
-    ):
-        self.doc_id = doc_id
-        self.chunk_id = chunk_id
-        self.title = title
-        self.content = content
-        self.score = score
-        self.distance = distance
-        self.metadata = metadata or {}
+    doc_id: str
+    chunk_id: str
+    title: str
+    content: str
+    score: float
+    distance: Optional[float] = None
+    metadata: Optional[dict] = None
+    # 内容预览缓存（slots 类不能使用 cached_property），首次访问 content_preview 时生成
+    _preview: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.metadata is None:
+            self.metadata = {}
+
+    @property
+    def content_preview(self) -> str:
+        """内容预览（超过 200 字符时截断并追加 "..."），同一对象只生成一次"""
+        if self._preview is None:
+            content = self.content
+            self._preview = content[:200] + "..." if len(content) > 200 else content
+        return self._preview
 
     def to_dict(self) -> dict:
         """转换为字典"""
@@ -36,7 +76,7 @@ class SearchResult:
             "doc_id": self.doc_id,
             "chunk_id": self.chunk_id,
             "title": self.title,
-            "content": self.content[:200] + "..." if len(self.content) > 200 else self.content,
+            "content": self.content_preview,
             "score": self.score,
             "distance": self.distance,
             "metadata": self.metadata
@@ -44,15 +84,17 @@ class SearchResult:
 
     @classmethod
     def from_milvus_hit(cls, hit) -> "SearchResult":
-        """从 Milvus 命中结果创建"""
+        """从 Milvus 命中结果创建（未请求的字段为空）"""
+        _get = hit.entity.get
+        # 按字段顺序位置传参（doc_id, chunk_id, title, content, score, distance, metadata），省去关键字匹配
         return cls(
-            doc_id=hit.entity.get("doc_id"),
-            chunk_id=hit.entity.get("chunk_id"),
-            title=hit.entity.get("title"),
-            content=hit.entity.get("content"),
-            score=hit.score,
-            distance=hit.distance,
-            metadata=hit.entity.get("metadata")
+            _get("doc_id"),
+            _get("chunk_id"),
+            _get("title"),
+            _get("content") or "",
+            hit.score,
+            hit.distance,
+            _get("metadata")
         )
 
 
@@ -80,6 +122,9 @@ class HybridSearcher:
         self.collection = collection
         self.dense_search_field = dense_search_field
         self.sparse_search_field = sparse_search_field
+        # 检索参数只构建一次，各次检索共用
+        self._dense_params = {"metric_type": "IP", "params": {"ef": 256}}
+        self._sparse_params = {"metric_type": "IP", "params": {"drop_ratio_search": 0.1}}
 
         logger.info("混合检索器初始化完成")
 
@@ -87,7 +132,8 @@ class HybridSearcher:
         self,
         query_vector: List[float],
         top_k: int = 10,
-        expr: Optional[str] = None
+        expr: Optional[str] = None,
+        output_fields: Optional[List[str]] = None
     ) -> List[SearchResult]:
         """
         Dense 向量检索
@@ -96,31 +142,63 @@ class HybridSearcher:
             query_vector: 查询向量
             top_k: 返回结果数量
             expr: 过滤表达式
+            output_fields: 返回字段，默认返回全部标量字段；只需要 ID 时传 ["doc_id"] 可减少传输量
 
         Returns:
             List[SearchResult]: 检索结果列表
         """
-        search_params = {
-            "metric_type": "IP",
-            "params": {"ef": 256}
-        }
-
         results = self.collection.search(
             data=[query_vector],
             anns_field=self.dense_search_field,
-            param=search_params,
+            param=self._dense_params,
             limit=top_k,
             expr=expr,
-            output_fields=["doc_id", "chunk_id", "title", "content", "metadata"]
+            output_fields=output_fields or DEFAULT_OUTPUT_FIELDS
         )
 
         return [SearchResult.from_milvus_hit(hit) for hit in results[0]]
 
+    def dense_search_batch(
+        self,
+        query_vectors: List[List[float]],
+        top_k: int = 10,
+        expr: Optional[str] = None,
+        output_fields: Optional[List[str]] = None
+    ) -> List[List[SearchResult]]:
+        """
+        批量 Dense 向量检索
+
+        一次 RPC 提交所有查询向量，减少逐条检索的网络与序列化开销
+
+        Args:
+            query_vectors: 查询向量列表（或二维数组）
+            top_k: 每个查询返回结果数量
+            expr: 过滤表达式
+            output_fields: 返回字段，默认返回全部标量字段；只需要 ID 时传 ["doc_id"] 可减少传输量
+
+        Returns:
+            List[List[SearchResult]]: 与查询顺序一致的检索结果列表
+        """
+        if len(query_vectors) == 0:
+            return []
+
+        results = self.collection.search(
+            data=list(query_vectors),
+            anns_field=self.dense_search_field,
+            param=self._dense_params,
+            limit=top_k,
+            expr=expr,
+            output_fields=output_fields or DEFAULT_OUTPUT_FIELDS
+        )
+
+        return [[SearchResult.from_milvus_hit(hit) for hit in hits] for hits in results]
+
     def sparse_search(
         self,
         query_sparse: Dict[int, float],
         top_k: int = 10,
-        expr: Optional[str] = None
+        expr: Optional[str] = None,
+        output_fields: Optional[List[str]] = None
     ) -> List[SearchResult]:
         """
         Sparse 向量检索
@@ -129,26 +207,57 @@ class HybridSearcher:
             query_sparse: 查询稀疏向量
             top_k: 返回结果数量
             expr: 过滤表达式
+            output_fields: 返回字段，默认返回全部标量字段；只需要 ID 时传 ["doc_id"] 可减少传输量
 
         Returns:
             List[SearchResult]: 检索结果列表
         """
-        search_params = {
-            "metric_type": "IP",
-            "params": {"drop_ratio_search": 0.1}
-        }
-
         results = self.collection.search(
             data=[query_sparse],
             anns_field=self.sparse_search_field,
-            param=search_params,
+            param=self._sparse_params,
             limit=top_k,
             expr=expr,
-            output_fields=["doc_id", "chunk_id", "title", "content", "metadata"]
+            output_fields=output_fields or DEFAULT_OUTPUT_FIELDS
         )
 
         return [SearchResult.from_milvus_hit(hit) for hit in results[0]]
 
+    def sparse_search_batch(
+        self,
+        query_sparses: List[Dict[int, float]],
+        top_k: int = 10,
+        expr: Optional[str] = None,
+        output_fields: Optional[List[str]] = None
+    ) -> List[List[SearchResult]]:
+        """
+        批量 Sparse 向量检索
+
+        一次 RPC 提交所有查询稀疏向量
+
+        Args:
+            query_sparses: 查询稀疏向量列表
+            top_k: 每个查询返回结果数量
+            expr: 过滤表达式
+            output_fields: 返回字段，默认返回全部标量字段；只需要 ID 时传 ["doc_id"] 可减少传输量
+
+        Returns:
+            List[List[SearchResult]]: 与查询顺序一致的检索结果列表
+        """
+        if len(query_sparses) == 0:
+            return []
+
+        results = self.collection.search(
+            data=list(query_sparses),
+            anns_field=self.sparse_search_field,
+            param=self._sparse_params,
+            limit=top_k,
+            expr=expr,
+            output_fields=output_fields or DEFAULT_OUTPUT_FIELDS
+        )
+
+        return [[SearchResult.from_milvus_hit(hit) for hit in hits] for hits in results]
+
     def hybrid_search(
         self,
         query_dense: List[float],
@@ -157,11 +266,17 @@ class HybridSearcher:
         fusion_method: str = "rrf",
         rrf_k: int = 60,
         dense_weight: float = 0.5,
-        sparse_weight: float = 0.5
+        sparse_weight: float = 0.5,
+        output_fields: Optional[List[str]] = None,
+        expr: Optional[str] = None,
+        candidate_k: Optional[int] = None
     ) -> List[SearchResult]:
         """
         混合检索（Dense + Sparse）
 
+        两路检索相互独立：Sparse 一路以 _async=True 先发起（返回 SearchFuture），
+        Dense 一路在当前线程同步执行，两者在服务端并行，无需线程池
+
         Args:
             query_dense: Dense 查询向量
             query_sparse: Sparse 查询向量
@@ -170,13 +285,21 @@ class HybridSearcher:
             rrf_k: RRF 参数 k
             dense_weight: Dense 权重（用于 weighted 融合）
             sparse_weight: Sparse 权重（用于 weighted 融合）
+            output_fields: 返回字段，融合所需的 chunk_id 会自动补充；两路候选只拉取 doc_id / chunk_id，
+                其余字段在融合后只为最终结果补全
+            expr: 过滤表达式（两路检索共用）
+            candidate_k: 每路拉取的候选数量，默认 top_k * 2；候选较深（不少于 64 且不少于 top_k 的 4 倍）时 RRF 融合可提前终止
 
         Returns:
             List[SearchResult]: 融合后的检索结果列表
         """
-        # 执行两路检索，获取更多结果用于融合
-        dense_results = self.dense_search(query_dense, top_k=top_k * 2)
-        sparse_results = self.sparse_search(query_sparse, top_k=top_k * 2)
+        candidate_fields, hydrate_fields = self._split_fields(output_fields)
+        limit = candidate_limit(top_k, candidate_k)
+
+        # 并行执行两路检索，获取更多结果用于融合（候选只拉取 ID，不传输正文）
+        sparse_future = self._submit_sparse_search([query_sparse], limit, expr, candidate_fields)
+        dense_results = self.dense_search(query_dense, top_k=limit, expr=expr, output_fields=candidate_fields)
+        sparse_results = [SearchResult.from_milvus_hit(hit) for hit in sparse_future.result()[0]]
 
         # 结果融合
         if fusion_method == "rrf":
@@ -186,9 +309,153 @@ class HybridSearcher:
                 dense_results, sparse_results, top_k, dense_weight, sparse_weight
             )
 
+        fused_results = self._hydrate([fused_results], hydrate_fields)[0]
+
         logger.debug(f"混合检索完成: Dense={len(dense_results)}, Sparse={len(sparse_results)}, Fused={len(fused_results)}")
         return fused_results
 
+    def hybrid_search_batch(
+        self,
+        query_denses: List[List[float]],
+        query_sparses: List[Dict[int, float]],
+        top_k: int = 10,
+        fusion_method: str = "rrf",
+        rrf_k: int = 60,
+        dense_weight: float = 0.5,
+        sparse_weight: float = 0.5,
+        output_fields: Optional[List[str]] = None,
+        expr: Optional[str] = None,
+        candidate_k: Optional[int] = None
+    ) -> List[List[SearchResult]]:
+        """
+        批量混合检索（Dense + Sparse）
+
+        两路各为一次批量 RPC：Sparse 一路以 _async=True 发起（返回 SearchFuture），
+        Dense 一路在当前线程同步执行，两者在服务端并行，随后逐查询融合
+
+        Args:
+            query_denses: Dense 查询向量列表（或二维数组）
+            query_sparses: 与 query_denses 对应的 Sparse 查询向量列表
+            top_k: 每个查询返回结果数量
+            fusion_method: 融合方法，"rrf" 或 "weighted"
+            rrf_k: RRF 参数 k
+            dense_weight: Dense 权重（用于 weighted 融合）
+            sparse_weight: Sparse 权重（用于 weighted 融合）
+            output_fields: 返回字段，融合所需的 chunk_id 会自动补充；两路候选只拉取 doc_id / chunk_id，
+                其余字段在融合后只为最终结果补全
+            expr: 过滤表达式（两路检索共用）
+            candidate_k: 每路拉取的候选数量，默认 top_k * 2；候选较深（不少于 64 且不少于 top_k 的 4 倍）时 RRF 融合可提前终止
+
+        Returns:
+            List[List[SearchResult]]: 与查询顺序一致的融合结果列表
+        """
+        if len(query_denses) == 0:
+            return []
+
+        candidate_fields, hydrate_fields = self._split_fields(output_fields)
+        limit = candidate_limit(top_k, candidate_k)
+
+        sparse_future = self._submit_sparse_search(query_sparses, limit, expr, candidate_fields)
+        dense_batch = self.dense_search_batch(
+            query_denses, top_k=limit, expr=expr, output_fields=candidate_fields
+        )
+        sparse_batch = [
+            [SearchResult.from_milvus_hit(hit) for hit in hits]
+            for hits in sparse_future.result()
+        ]
+
+        if fusion_method == "rrf":
+            fused_batch = [
+                self._rrf_fusion(dense_results, sparse_results, top_k, rrf_k)
+                for dense_results, sparse_results in zip(dense_batch, sparse_batch)
+            ]
+        else:
+            fused_batch = [
+                self._weighted_fusion(dense_results, sparse_results, top_k, dense_weight, sparse_weight)
+                for dense_results, sparse_results in zip(dense_batch, sparse_batch)
+            ]
+
+        # 所有查询的最终结果一次补全
+        return self._hydrate(fused_batch, hydrate_fields)
+
+    def _submit_sparse_search(
+        self,
+        query_sparses: List[Dict[int, float]],
+        limit: int,
+        expr: Optional[str],
+        output_fields: List[str]
+    ):
+        """以 _async=True 发起批量 Sparse 检索，立即返回 pymilvus SearchFuture"""
+        return self.collection.search(
+            data=list(query_sparses),
+            anns_field=self.sparse_search_field,
+            param=self._sparse_params,
+            limit=limit,
+            expr=expr,
+            output_fields=output_fields,
+            _async=True
+        )
+
+    @staticmethod
+    def _split_fields(output_fields: Optional[List[str]]) -> Tuple[List[str], List[str]]:
+        """
+        将混合检索的返回字段拆分为两路候选拉取的字段与融合后补全的字段
+
+        Returns:
+            Tuple[List[str], List[str]]: (候选字段，始终包含 chunk_id, 融合后补全的字段)
+        """
+        fields = output_fields or DEFAULT_OUTPUT_FIELDS
+        candidate_fields = [f for f in fields if f in CANDIDATE_FIELDS]
+        if "chunk_id" not in candidate_fields:
+            candidate_fields.append("chunk_id")
+        hydrate_fields = [f for f in fields if f not in CANDIDATE_FIELDS]
+        return candidate_fields, hydrate_fields
+
+    def _hydrate(
+        self,
+        fused_batch: List[List[SearchResult]],
+        fields: List[str]
+    ) -> List[List[SearchResult]]:
+        """
+        为融合后的最终结果补全 title / content / metadata
+
+        两路候选只拉取 ID，被融合淘汰的候选不再传输正文；所有查询的结果一次查询补全
+
+        Args:
+            fused_batch: 各查询的融合结果
+            fields: 需要补全的字段
+
+        Returns:
+            List[List[SearchResult]]: 补全后的融合结果
+        """
+        if not fields:
+            return fused_batch
+
+        chunk_ids = list(dict.fromkeys(r.chunk_id for results in fused_batch for r in results))
+        rows = fetch_by_chunk_ids(self.collection, chunk_ids, fields)
+        if len(rows) < len(chunk_ids):
+            logger.warning(f"融合结果补全字段时有 {len(chunk_ids) - len(rows)} 个 chunk_id 未找到")
+
+        hydrated_batch = []
+        for results in fused_batch:
+            hydrated = []
+            for result in results:
+                row = rows.get(result.chunk_id)
+                if row is None:
+                    hydrated.append(result)
+                    continue
+                updates = {}
+                if "title" in fields:
+                    updates["title"] = row.get("title")
+                if "content" in fields:
+                    updates["content"] = row.get("content") or ""
+                if "metadata" in fields:
+                    # 融合信息（fusion_score 等）保留在原 metadata 之后
+                    updates["metadata"] = {**(row.get("metadata") or {}), **result.metadata}
+                hydrated.append(replace(result, **updates))
+            hydrated_batch.append(hydrated)
+        return hydrated_batch
+
     def _rrf_fusion(
         self,
         dense_results: List[SearchResult],
@@ -210,35 +477,24 @@ class HybridSearcher:
         Returns:
             List[SearchResult]: 融合后的结果
         """
-        scores = defaultdict(float)
-        doc_data: Dict[str, SearchResult] = {}
-
-        # 处理 Dense 结果
-        for rank, result in enumerate(dense_results, 1):
-            doc_id = result.chunk_id  # 使用 chunk_id 唯一标识
-            scores[doc_id] += 1.0 / (k + rank)
-            if doc_id not in doc_data:
-                doc_data[doc_id] = result
-
-        # 处理 Sparse 结果
-        for rank, result in enumerate(sparse_results, 1):
-            doc_id = result.chunk_id
-            scores[doc_id] += 1.0 / (k + rank)
-            if doc_id not in doc_data:
-                doc_data[doc_id] = result
-
-        # 排序
-        sorted_docs = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        # 按候选规模选择融合内核，结果为 (路序号, 排名下标, 分数)，映射回对应的检索结果
+        legs = (dense_results, sparse_results)
+        ranked = [
+            (legs[leg][rank], score)
+            for leg, rank, score in fuse_rrf(
+                [r.chunk_id for r in dense_results], [r.chunk_id for r in sparse_results], k, top_k
+            )
+        ]
 
         # 创建融合结果
         fused_results = []
-        for doc_id, rrf_score in sorted_docs[:top_k]:
-            result = doc_data[doc_id]
-            # 更新分数为 RRF 分数
-            result.score = rrf_score
-            result.metadata["fusion_score"] = rrf_score
-            result.metadata["fusion_method"] = "rrf"
-            fused_results.append(result)
+        for result, rrf_score in ranked:
+            # 生成新的结果对象（分数为 RRF 分数），不修改两路检索的原始结果
+            fused_results.append(replace(
+                result,
+                score=rrf_score,
+                metadata={**result.metadata, "fusion_score": rrf_score, "fusion_method": "rrf"}
+            ))
 
         return fused_results
 
@@ -267,15 +523,12 @@ class HybridSearcher:
         doc_data: Dict[str, SearchResult] = {}
 
         # 获取分数并归一化
-        dense_scores = {r.chunk_id: r.score for r in dense_results}
-        sparse_scores = {r.chunk_id: r.score for r in sparse_results}
-
-        max_dense = max(dense_scores.values()) if dense_scores else 1.0
-        max_sparse = max(sparse_scores.values()) if sparse_scores else 1.0
+        max_dense = max((r.score for r in dense_results), default=1.0)
+        max_sparse = max((r.score for r in sparse_results), default=1.0)
 
         # 融合 Dense 结果
         for result in dense_results:
-            doc_id = result.chunk_id
+            doc_id = intern(result.chunk_id)
             dense_norm = result.score / max_dense
             scores[doc_id] += dense_weight * dense_norm
             if doc_id not in doc_data:
@@ -283,7 +536,7 @@ class HybridSearcher:
 
         # 融合 Sparse 结果
         for result in sparse_results:
-            doc_id = result.chunk_id
+            doc_id = intern(result.chunk_id)
             sparse_norm = result.score / max_sparse
             if doc_id in scores:
                 scores[doc_id] += sparse_weight * sparse_norm
@@ -291,17 +544,18 @@ class HybridSearcher:
                 scores[doc_id] = sparse_weight * sparse_norm
                 doc_data[doc_id] = result
 
-        # 排序
-        sorted_docs = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        # 取前 top_k（堆选取，无需对全部候选排序）
+        sorted_docs = top_k_items(scores, top_k)
 
         # 创建融合结果
         fused_results = []
-        for doc_id, fusion_score in sorted_docs[:top_k]:
+        for doc_id, fusion_score in sorted_docs:
             result = doc_data[doc_id]
-            result.score = fusion_score
-            result.metadata["fusion_score"] = fusion_score
-            result.metadata["fusion_method"] = "weighted"
-            fused_results.append(result)
+            fused_results.append(replace(
+                result,
+                score=fusion_score,
+                metadata={**result.metadata, "fusion_score": fusion_score, "fusion_method": "weighted"}
+            ))
 
         return fused_results
 
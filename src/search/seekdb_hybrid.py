@@ -3,6 +3,8 @@ SeekDB 混合检索模块 - 使用内置 hybrid_search API
 """
 
 from typing import List, Optional
+
+import numpy as np
 from loguru import logger
 
 from src.search.hybrid_search import SearchResult
@@ -68,81 +70,87 @@ class SeekDBHybridSearcher:
         fusion_method: str = "rrf",
         rrf_k: int = 60,
         dense_weight: float = 0.5,
-        sparse_weight: float = 0.5
+        sparse_weight: float = 0.5,
+        query_embedding: Optional[List[float]] = None
     ) -> List[SearchResult]:
         """
         混合检索（使用 SeekDB 内置 hybrid_search API）
 
         注意：SeekDB 只支持 RRF 融合，不支持加权融合
+
+        提供 query_embedding 时向量检索直接使用该向量，不再调用 embedding_function
         """
+        if query_embedding is not None:
+            knn = {"query_embeddings": [query_embedding], "n_results": top_k * 2}
+        else:
+            knn = {"query_texts": [query_text], "n_results": top_k * 2}
+
         # 使用 SeekDB 内置的 hybrid_search
         results = self.collection.hybrid_search(
             query={"where_document": {"$contains": query_text}, "n_results": top_k * 2},
-            knn={"query_texts": [query_text], "n_results": top_k * 2},
+            knn=knn,
             rank={"rrf": {}},
             n_results=top_k
         )
 
         return self._format_hybrid_results(results)
 
+    @staticmethod
+    def _columns(results):
+        """
+        取出单条查询结果的各列，循环内只访问局部列表
+
+        Returns:
+            ids, metadatas, documents, distances；缺失的列按 ids 长度补齐（distances 缺失时为 None）
+        """
+        ids = results['ids'][0]
+        n = len(ids)
+        metas = results['metadatas'][0] if results.get('metadatas') else [{}] * n
+        docs = results['documents'][0] if results.get('documents') else [""] * n
+        dists = results['distances'][0] if results.get('distances') else None
+        return ids, metas, docs, dists
+
+    @staticmethod
+    def _make_result(chunk_id_default, metadata, content, score, distance=None) -> SearchResult:
+        """由一行结果构造 SearchResult"""
+        chunk_id = metadata.get("chunk_id", chunk_id_default)
+        # 从 metadata 中获取 doc_id，缺失时尝试从 chunk_id 中提取
+        doc_id = metadata.get("doc_id", "")
+        if not doc_id:
+            doc_id = chunk_id.split("_")[0] if "_" in chunk_id else chunk_id
+        return SearchResult(doc_id, chunk_id, metadata.get("title", ""), content, score, distance, metadata)
+
     def _format_results(self, results) -> List[SearchResult]:
         """格式化查询结果"""
-        formatted = []
-        if not results['ids'][0]:
-            return formatted
-
-        for i in range(len(results['ids'][0])):
-            metadata = results['metadatas'][0][i] if results.get('metadatas') else {}
-            # 将距离转换为分数
-            if results.get('distances') and results['distances'][0]:
-                distance = results['distances'][0][i]
-                score = 1.0 / (1.0 + distance)
-            else:
-                score = 1.0 / (1.0 + i)
-
-            # 从 metadata 中获取 doc_id
-            doc_id = metadata.get("doc_id", "")
-            if not doc_id:
-                # 尝试从 chunk_id 中提取 doc_id
-                chunk_id = metadata.get("chunk_id", results['ids'][0][i])
-                doc_id = chunk_id.split("_")[0] if "_" in chunk_id else chunk_id
-
-            formatted.append(SearchResult(
-                doc_id=doc_id,
-                chunk_id=metadata.get("chunk_id", results['ids'][0][i]),
-                title=metadata.get("title", ""),
-                content=results['documents'][0][i] if results.get('documents') else "",
-                score=score,
-                distance=results['distances'][0][i] if results.get('distances') else None,
-                metadata=metadata
-            ))
-        return formatted
+        ids, metas, docs, dists = self._columns(results)
+        if not ids:
+            return []
+
+        # 将距离转换为分数（整列一次计算）；无距离时按排名给分
+        if dists:
+            scores = (1.0 / (1.0 + np.asarray(dists, dtype=np.float64))).tolist()
+        else:
+            scores = (1.0 / np.arange(1, len(ids) + 1, dtype=np.float64)).tolist()
+        distances = dists if dists is not None else [None] * len(ids)
+
+        make_result = self._make_result
+        return [
+            make_result(rid, metadata, content, score, distance)
+            for rid, metadata, content, score, distance in zip(ids, metas, docs, scores, distances)
+        ]
 
     def _format_hybrid_results(self, results) -> List[SearchResult]:
         """格式化混合检索结果"""
-        formatted = []
-        if not results['ids'][0]:
-            return formatted
-
-        for i in range(len(results['ids'][0])):
-            metadata = results['metadatas'][0][i] if results.get('metadatas') else {}
-
-            # hybrid_search 返回的是融合后的排名
-            # 使用排名作为分数（排名越前分数越高）
-            score = 1.0 / (1.0 + i)
-
-            # 从 metadata 中获取 doc_id
-            doc_id = metadata.get("doc_id", "")
-            if not doc_id:
-                chunk_id = metadata.get("chunk_id", results['ids'][0][i])
-                doc_id = chunk_id.split("_")[0] if "_" in chunk_id else chunk_id
-
-            formatted.append(SearchResult(
-                doc_id=doc_id,
-                chunk_id=metadata.get("chunk_id", results['ids'][0][i]),
-                title=metadata.get("title", ""),
-                content=results['documents'][0][i] if results.get('documents') else "",
-                score=score,
-                metadata=metadata
-            ))
-        return formatted
+        ids, metas, docs, _ = self._columns(results)
+        if not ids:
+            return []
+
+        # hybrid_search 返回的是融合后的排名
+        # 使用排名作为分数（排名越前分数越高）
+        scores = (1.0 / np.arange(1, len(ids) + 1, dtype=np.float64)).tolist()
+
+        make_result = self._make_result
+        return [
+            make_result(rid, metadata, content, score)
+            for rid, metadata, content, score in zip(ids, metas, docs, scores)
+        ]
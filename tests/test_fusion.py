@@ -0,0 +1,202 @@
+"""
+fusion 模块测试：提前终止 RRF、NumPy 内核、fuse_rrf 与逐条累加结果一致，
+以及两个混合检索器的 _rrf_fusion 在实际候选深度下的结果
+"""
+
+import random
+from collections import defaultdict
+from types import SimpleNamespace
+
+import pytest
+
+from src.search.fusion import candidate_limit, fuse_rrf, rrf_top_k, rrf_top_k_early, rrf_weights, use_early_exit
+
+
+def _accumulate(first_ids, second_ids, k, top_k):
+    """参考实现：两路依次逐条累加，同分按首次出现位置排序"""
+    scores = defaultdict(float)
+    first_pos = {}
+    for offset, ids in ((0, first_ids), (len(first_ids), second_ids)):
+        weights = rrf_weights(k, len(ids))
+        for rank, doc_id in enumerate(ids):
+            scores[doc_id] += weights[rank]
+            first_pos.setdefault(doc_id, offset + rank)
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], first_pos[item[0]]))
+    return [(doc_id, score) for doc_id, score in ranked[:top_k]]
+
+
+def _early(first_ids, second_ids, k, top_k):
+    legs = (first_ids, second_ids)
+    return [(legs[leg][rank], score) for leg, rank, score in rrf_top_k_early(first_ids, second_ids, k, top_k)]
+
+
+def _numpy(first_ids, second_ids, k, top_k):
+    candidates = [*first_ids, *second_ids]
+    return [(candidates[pos], score) for pos, score in rrf_top_k([first_ids, second_ids], k, top_k)]
+
+
+def _fuse(first_ids, second_ids, k, top_k):
+    legs = (first_ids, second_ids)
+    return [(legs[leg][rank], score) for leg, rank, score in fuse_rrf(first_ids, second_ids, k, top_k)]
+
+
+def _candidate_legs(rng, depth, universe):
+    """模拟两路检索的候选：每路按排名排列、主键不重复，两路部分重叠"""
+    pool = [f"chunk_{i}" for i in range(universe)]
+    return rng.sample(pool, min(depth, universe)), rng.sample(pool, min(depth, universe))
+
+
+def test_same_leg_duplicate_is_not_settled():
+    # X 在第一路排名 0 和 5、第二路排名 88：同路重复不能视为“两路都已出现”
+    first = ["X"] + [f"a{i}" for i in range(1, 5)] + ["X"] + [f"a{i}" for i in range(6, 100)]
+    second = [f"a{i}" for i in range(1, 89)] + ["X"] + [f"b{i}" for i in range(89, 100)]
+
+    result = _early(first, second, 60, 5)
+
+    assert result == _accumulate(first, second, 60, 5)
+    assert result[0][0] == "X"
+
+
+@pytest.mark.parametrize("with_duplicates", [False, True])
+def test_matches_accumulation_and_numpy(with_duplicates):
+    rng = random.Random(0)
+    for _ in range(2000):
+        universe = rng.choice([20, 80, 300])
+        first = [f"d{rng.randrange(universe)}" for _ in range(rng.randint(0, 150))]
+        second = [f"d{rng.randrange(universe)}" for _ in range(rng.randint(0, 150))]
+        if not with_duplicates:
+            first = list(dict.fromkeys(first))
+            second = list(dict.fromkeys(second))
+        k = rng.choice([0, 1, 60])
+        top_k = rng.randint(1, 30)
+
+        expected = _accumulate(first, second, k, top_k)
+        assert _early(first, second, k, top_k) == expected
+        assert _numpy(first, second, k, top_k) == expected
+        assert _fuse(first, second, k, top_k) == expected
+
+
+def test_duplicate_after_stop_point():
+    # 同路重复出现在提前终止点之后，仍需计入分数
+    shared = [f"s{i}" for i in range(100)]
+    first = [*shared, *["Y"] * 6]
+    second = [*shared, "Y"]
+
+    result = _early(first, second, 60, 5)
+
+    assert result == _accumulate(first, second, 60, 5)
+    assert result[0][0] == "Y"
+
+
+@pytest.mark.parametrize("top_k, candidate_k", [(10, None), (10, 200), (10, 400), (50, None)])
+def test_fuse_rrf_at_search_depths(top_k, candidate_k):
+    # 覆盖三种内核：默认 top_k * 2 的逐条累加、candidate_k 较深时的提前终止、两路合计较多时的 NumPy 内核
+    rng = random.Random(1)
+    depth = candidate_limit(top_k, candidate_k)
+    for _ in range(200):
+        first, second = _candidate_legs(rng, depth, rng.choice([depth, depth * 2, depth * 5]))
+        assert _fuse(first, second, 60, top_k) == _accumulate(first, second, 60, top_k)
+
+
+def test_candidate_limit_reaches_early_exit():
+    assert candidate_limit(10) == 20
+    assert not use_early_exit(candidate_limit(10), 10)
+    assert candidate_limit(10, 200) == 200
+    assert use_early_exit(candidate_limit(10, 200), 10)
+    # candidate_k 小于 top_k 时仍至少拉取 top_k 条
+    assert candidate_limit(10, 5) == 10
+
+
+@pytest.mark.parametrize("candidate_k", [None, 200])
+def test_hybrid_searcher_rrf_fusion(candidate_k):
+    pytest.importorskip("pymilvus")
+    from src.search.hybrid_search import HybridSearcher, SearchResult
+
+    rng = random.Random(2)
+    top_k = 10
+    depth = candidate_limit(top_k, candidate_k)
+    searcher = HybridSearcher.__new__(HybridSearcher)
+    for _ in range(50):
+        dense_ids, sparse_ids = _candidate_legs(rng, depth, depth * 3)
+        # 两路候选只拉取 doc_id / chunk_id（CANDIDATE_FIELDS）
+        dense = [SearchResult(f"doc_{i}", i, None, "", 1.0 - rank / depth) for rank, i in enumerate(dense_ids)]
+        sparse = [SearchResult(f"doc_{i}", i, None, "", 10.0 - rank) for rank, i in enumerate(sparse_ids)]
+
+        fused = searcher._rrf_fusion(dense, sparse, top_k, 60)
+
+        assert [(r.chunk_id, r.score) for r in fused] == _accumulate(dense_ids, sparse_ids, 60, top_k)
+        for result in fused:
+            assert result.doc_id == f"doc_{result.chunk_id}"
+            assert result.metadata == {"fusion_score": result.score, "fusion_method": "rrf"}
+        # 原始候选不被修改
+        assert all(r.metadata == {} for r in dense + sparse)
+
+
+def test_hybrid_search_batch_pulls_candidate_k():
+    pytest.importorskip("pymilvus")
+    from src.search.hybrid_search import HybridSearcher
+
+    limits = []
+
+    class _Collection:
+        """按 limit 返回固定排名候选的 Collection 替身，记录每路拉取的数量"""
+
+        def search(self, data, anns_field, param, limit, expr, output_fields, _async=False):
+            limits.append(limit)
+            offset = 0 if anns_field == "dense_vector" else limit // 2
+            hits = [
+                [
+                    SimpleNamespace(
+                        entity={"doc_id": f"doc_{i}", "chunk_id": f"chunk_{i}"},
+                        score=float(limit - rank),
+                        distance=float(limit - rank)
+                    )
+                    for rank, i in enumerate(range(offset, offset + limit))
+                ]
+                for _ in data
+            ]
+            return SimpleNamespace(result=lambda: hits) if _async else hits
+
+    searcher = HybridSearcher(_Collection())
+    fused = searcher.hybrid_search_batch(
+        [[0.1, 0.2]], [{1: 0.5}], top_k=10, output_fields=["doc_id"], candidate_k=200
+    )
+
+    assert limits == [200, 200]
+    dense_ids = [f"chunk_{i}" for i in range(200)]
+    sparse_ids = [f"chunk_{i}" for i in range(100, 300)]
+    assert [(r.chunk_id, r.score) for r in fused[0]] == _accumulate(dense_ids, sparse_ids, 60, 10)
+
+
+@pytest.mark.parametrize("candidate_k", [None, 200])
+def test_es_mv_searcher_rrf_fusion(candidate_k):
+    pytest.importorskip("pymilvus")
+    pytest.importorskip("elasticsearch")
+    from src.search.es_mv_hybrid import ESMVHybridSearcher
+
+    rng = random.Random(3)
+    top_k = 10
+    depth = candidate_limit(top_k, candidate_k)
+    searcher = ESMVHybridSearcher.__new__(ESMVHybridSearcher)
+    for _ in range(50):
+        es_ids, dense_ids = _candidate_legs(rng, depth, depth * 3)
+        # ES 结果自带正文，Dense 候选只有 doc_id / chunk_id
+        es_results = [
+            {"doc_id": f"doc_{i}", "chunk_id": i, "title": "t", "content": "c", "score": 10.0 - rank, "source": "ES"}
+            for rank, i in enumerate(es_ids)
+        ]
+        dense_results = [
+            {"doc_id": f"doc_{i}", "chunk_id": i, "title": None, "content": None, "score": 1.0 - rank / depth,
+             "source": "MV"}
+            for rank, i in enumerate(dense_ids)
+        ]
+
+        fused = searcher._rrf_fusion(es_results, dense_results, top_k, 60)
+
+        assert [(r["chunk_id"], r["fusion_score"]) for r in fused] == _accumulate(es_ids, dense_ids, 60, top_k)
+        es_set = set(es_ids)
+        for result in fused:
+            assert result["source"] == "ES+MV"
+            assert result["fusion_method"] == "es_mv_rrf"
+            # 两路都出现时保留先出现的 ES 一路结果
+            assert (result["content"] == "c") == (result["chunk_id"] in es_set)